@@ -0,0 +1,60 @@
+# Benchmark the overhead of Paranoid Scientist's runtime checks.
+#
+# Run with "python benchmark.py".  Each benchmark is run in checked mode
+# (the default) and in production mode.
+
+import timeit
+from cand import Canvas, Point, Vector, Width, Height
+from cand import enable_production_mode, disable_production_mode
+
+def make_canvas():
+    c = Canvas(6, 4, "inches")
+    c.add_axis("ax", Point(.1, .1, "figure"), Point(.9, .9, "figure"))
+    c.add_unit("half", Vector(.5, .5, "figure"), Point(.1, .1, "figure"))
+    return c
+
+def build_expressions():
+    for i in range(0, 100):
+        p = Point(i, i, "figure") + Vector(1, 2, "cm")*2 - Width(3, "pt")
+        v = (Vector(1, 1, "absolute") @ 30).width() + Height(i, "mm")/2
+        (p | Point(0, 0, "ax")) >> (p + v)
+
+# Distinct expressions, built in advance so that only the conversions are
+# timed.  The conversion cache is cleared before each conversion, since
+# otherwise repeated runs would only time cache hits.
+data_points = [((Point(.5, .5, "ax") + Vector(1, 1, "cm") @ 45) | Point(1, i/100, "half")) >> Point(0, 0, "figure") - Width(2, "pt")
+               for i in range(0, 100)]
+unit_points = [((Point(.5, .5, "half") + Vector(1, 1, "cm") @ 45) | Point(1, i/100, "axis_ax")) >> Point(0, 0, "figure") - Width(2, "pt")
+               for i in range(0, 100)]
+
+def convert_points(c):
+    for p in data_points:
+        c._conversion_cache.clear()
+        c.convert_to_absolute_coord(p)
+
+def convert_unit_points(c):
+    for p in unit_points:
+        c._conversion_cache.clear()
+        c.convert_to_absolute_coord(p)
+
+def run(name, func, number):
+    t = min(timeit.repeat(func, number=number, repeat=5))/number
+    print(f"{name:<30s} {t*1000:10.3f} ms")
+    return t
+
+benchmarks = [("Build 100 expressions", build_expressions),
+              ("Convert 100 points", lambda : convert_points(canvas)),
+              ("Convert 100 non-data points", lambda : convert_unit_points(canvas))]
+
+if __name__ == "__main__":
+    canvas = make_canvas()
+    print("Checked mode")
+    checked = [run(name, f, 10) for name,f in benchmarks]
+    enable_production_mode()
+    canvas = make_canvas()
+    print("Production mode")
+    production = [run(name, f, 10) for name,f in benchmarks]
+    disable_production_mode()
+    print("Speedup")
+    for (name,_),c,p in zip(benchmarks, checked, production):
+        print(f"{name:<30s} {c/p:10.1f}x")
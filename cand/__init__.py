@@ -1,4 +1,9 @@
 from ._version import __version__
 from .canvas import Canvas
-from .metrics import Metric, Vector, Point, BinopPoint, BinopVector, Height, Width
+from .metrics import Metric, Vector, Point, BinopPoint, BinopVector, Height, Width, PointArray, VectorArray
 from .fontant import find_font, find_font_family
+from .production import enable_production_mode, disable_production_mode, is_production_mode
+
+import os as _os
+if _os.environ.get("CAND_PRODUCTION", "0").lower() not in ["", "0", "false", "no"]:
+    enable_production_mode()
@@ -0,0 +1,5 @@
+# Command line interface, e.g. "python -m cand build-index"
+import sys
+from .fontant import main
+
+sys.exit(main())
@@ -0,0 +1,96 @@
+# Caches shared between modules
+import collections
+import threading
+
+class LRUCache:
+    """A thread-safe cache which evicts the least recently used items.
+
+    At most `maxsize` items are kept in the cache.  The number of
+    hits, misses, and evictions are counted, and can be viewed with
+    the stats method.
+    """
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._items = collections.OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    def get(self, key, default=None):
+        """Return the item for `key`, or `default` if it is not cached."""
+        with self._lock:
+            try:
+                value = self._items[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+    def set(self, key, value):
+        """Add `value` to the cache under the key `key`."""
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+                self.evictions += 1
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+    def clear(self):
+        """Remove all items from the cache.  This does not reset the stats."""
+        with self._lock:
+            self._items.clear()
+    def stats(self):
+        """Return a dict of the cache's hits, misses, evictions, and size."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "size": len(self._items), "maxsize": self.maxsize}
+
+class MemoryLRUCache(LRUCache):
+    """An LRUCache which also limits the memory used by its items.
+
+    `sizeof` is a function giving the size of an item in bytes.  Least
+    recently used items are evicted until at most `maxbytes` bytes are
+    used, or at most `maxsize` items are kept.  Items larger than
+    `maxbytes` are not cached at all.
+    """
+    def __init__(self, maxbytes, sizeof, maxsize=float("inf")):
+        super().__init__(maxsize=maxsize)
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.nbytes = 0
+    def set(self, key, value):
+        """Add `value` to the cache under the key `key`."""
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._items:
+                self.nbytes -= self.sizeof(self._items.pop(key))
+            if size > self.maxbytes:
+                return
+            self._items[key] = value
+            self.nbytes += size
+            self._evict()
+    def _evict(self):
+        while len(self._items) > self.maxsize or self.nbytes > self.maxbytes:
+            _,value = self._items.popitem(last=False)
+            self.nbytes -= self.sizeof(value)
+            self.evictions += 1
+    def resize(self, maxbytes):
+        """Change the memory limit to `maxbytes`, evicting items if necessary."""
+        with self._lock:
+            self.maxbytes = maxbytes
+            self._evict()
+    def clear(self):
+        """Remove all items from the cache.  This does not reset the stats."""
+        with self._lock:
+            self._items.clear()
+            self.nbytes = 0
+    def stats(self):
+        """Return a dict of the cache's hits, misses, evictions, size, and memory use."""
+        with self._lock:
+            return {**super().stats(), "bytes": self.nbytes, "maxbytes": self.maxbytes}
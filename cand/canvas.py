@@ -3,17 +3,88 @@ import paranoid as pns
 import numpy as np
 import matplotlib
 import matplotlib.figure
+import matplotlib.axes
 from PIL import Image, PngImagePlugin
 import fitz as mupdf # PyMuPDF
 import tempfile
+import io
 import atexit
 import os
-from .metrics import Metric, Vector, Point, BinopPoint, BinopVector, Height, Width
-from .fontant import find_font, find_font_family, MultipleFontsFoundError, NoFontFoundError
+import threading
+import math
+from .metrics import Metric, Vector, Point, MetaBinop, Height, Width, \
+    MetricArray, PointArray, VectorArray, BinopPointArray, BinopVectorArray, _affine_form
+from .fontant import find_font, find_font_family, MultipleFontsFoundError, NoFontFoundError, DEFAULT_FONT
 from ._version import __version__
+from .cache import LRUCache
+from . import raster
 
 _idstr = f"CanD {__version__} (github.com/mwshinn/cand)"
 
+# Text measurements are shared between Canvases, since they only depend on the
+# text, the font file, and the size.  They are all made with a single renderer
+# and figure at 72 dpi, so that sizes come out in points without changing the
+# dpi of any Canvas's figure.
+_text_size_cache = LRUCache(maxsize=4096)
+_text_renderer = None
+_text_figure = None
+_text_renderer_lock = threading.Lock()
+
+def _freeze(value):
+    # Convert lists and dicts (e.g. the `bbox` argument of add_text) into
+    # tuples, so that they can be part of a cache key.
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k,v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+class _TransformWatcher(matplotlib.transforms.TransformNode):
+    """Call `callback` whenever any of the given transforms or bboxes change.
+
+    This uses matplotlib's transform invalidation system, which notifies
+    the parents of a transform when it changes.  A transform or bbox only
+    notifies its parents of the first change after it was last read, so
+    `rearm` must be called after `callback` to be notified of later
+    changes.
+    """
+    pass_through = True
+    def __init__(self, callback, *children):
+        super().__init__()
+        self._callback = callback
+        self._watched = children
+        self.set_children(*children)
+    def _invalidate_internal(self, level, invalidating_node):
+        self._callback()
+    def rearm(self):
+        for child in self._watched:
+            if isinstance(child, matplotlib.transforms.BboxBase):
+                child.get_points()
+            else:
+                child.get_matrix()
+
+def _autoscale_settings(ax):
+    # The settings which determine the limits chosen by ax.autoscale_view,
+    # apart from the data.
+    return (ax.get_autoscalex_on(), ax.get_autoscaley_on(), ax.margins(), ax.use_sticky_edges)
+
+# Finding out when axes change relies on private parts of matplotlib (see
+# _TransformWatcher and Canvas._refresh_axes).  If a version of matplotlib
+# does not have them, conversions are not cached.
+_can_watch_axes = hasattr(matplotlib.transforms.TransformNode, "_invalidate_internal") and \
+    hasattr(matplotlib.axes.Axes, "_unstale_viewLim")
+
+class _NullWriter(io.RawIOBase):
+    """A file object which discards everything written to it."""
+    def writable(self):
+        return True
+    def write(self, data):
+        return len(data)
+
+def text_size_cache_stats():
+    """Return the hit/miss statistics for the Canvas.text_size cache."""
+    return _text_size_cache.stats()
+
 # If IPython is installed, try to import the display code for it.
 try:
     from IPython.display import Image as IPython_Image, display as IPython_display
@@ -49,7 +120,20 @@ class Canvas:
         self.fontsize_title = 8
         self.images = []
         self.tmpfiles = []
-        self.font = dict(name="DejaVu Sans", stretch="normal")
+        self.font = dict(DEFAULT_FONT)
+        self._fontprops_cache = {} # Cache for _get_font, cleared by set_font
+        # Cache for convert_to_absolute_coord.  It is cleared whenever
+        # self._version changes.
+        self._version = 0
+        self._conversion_cache = LRUCache(maxsize=4096)
+        self._conversion_cache_version = 0
+        self._axis_watchers = []
+        self._axis_watchers_version = -1 # The version when watchers were rearmed
+        self._autoscaled_axes = set() # Axes whose data coordinates have been used
+        self._autoscale_settings = {} # Autoscale settings of these axes
+        self._transform_cache = {} # Transforms from axis coordinates to absolute
+        self._transform_cache_version = 0
+        self._cache_conversions = _can_watch_axes
         atexit.register(self._cleanup)
         self.localRc = {}
         
@@ -74,6 +158,9 @@ class Canvas:
         self.figure = matplotlib.figure.Figure(figsize=figsize)
         self.size = figsize # Size of the figure in inches
         self.trans_absolute = self.figure.dpi_scale_trans
+        # Changing the dpi changes the cached axis transforms
+        if self._cache_conversions:
+            self._axis_watchers.append(_TransformWatcher(self._invalidate_conversions, self.figure.bbox))
 
         self.units = dict()
         self.add_unit("in", Vector(1/size_x_inches, 1/size_y_inches, "figure"))
@@ -134,6 +221,8 @@ class Canvas:
             e.args = ("Font specified in call to Canvas.set_font() was not specific enough.\n"+e.args[0],) + e.args[1:]
             raise
         self.font = newfont
+        self._fontprops_cache.clear()
+        self._invalidate_conversions()
         
     def _get_font(self, name=None, *, size=None, weight=None, style=None, stretch=None, foundry=None, special=None, opticalsize=None, monospace=None):
         if name is None:
@@ -160,6 +249,16 @@ class Canvas:
             defaultfont['opticalsize'] = opticalsize
         if size is None:
             size = self.fontsize
+        # Font searches and FontProperties objects are cached for each fully
+        # specified font, since this is called for every piece of text.
+        cachekey = tuple(defaultfont.get(k, None) for k in ['name', 'weight', 'style', 'stretch', 'foundry',
+                                                           'special', 'opticalsize', 'monospace']) + (size,)
+        if cachekey in self._fontprops_cache:
+            return self._fontprops_cache[cachekey]
+        fprops = self._find_font_properties(defaultfont, size)
+        self._fontprops_cache[cachekey] = fprops
+        return fprops
+    def _find_font_properties(self, defaultfont, size):
         # If we just want the bold or italic versions of a font, we can use the
         # font family method.
         if ('weight' not in defaultfont.keys() or defaultfont['weight'] == "bold") and \
@@ -215,6 +314,7 @@ class Canvas:
         scale = self.convert_to_absolute_length(scale)
         origin = self.convert_to_absolute_coord(origin)
         self.units[name] = (scale.width().x, scale.height().y, origin)
+        self._invalidate_conversions()
     @pns.accepts(pns.Self, pns.String)
     def set_default_unit(self, name):
         """Changes the default unit for the Canvas.
@@ -226,6 +326,7 @@ class Canvas:
         """
         assert self.is_unit(name), f"Invalid unit name {name!r} set as default"
         self.default_unit = name
+        self._invalidate_conversions()
     @pns.accepts(pns.Self, pns.String, Point, Point)
     @pns.ensures("not self.is_valid_identifier(name)")
     def add_axis(self, name, pos_ll, pos_ur):
@@ -257,6 +358,15 @@ class Canvas:
         pt_ur = self.convert_to_figure_coord(pos_ur)
         ax = self.figure.add_axes([pt_ll.x, pt_ll.y, pt_ur.x-pt_ll.x, pt_ur.y-pt_ll.y], label=name)
         self.axes[name] = ax
+        if not (hasattr(ax, "_position") and hasattr(ax, "_stale_viewlims")):
+            self._cache_conversions = False
+        if self._cache_conversions:
+            # Conversions in the axis' coordinates depend on its position,
+            # limits, scale, and data, so invalidate conversions when they
+            # change.
+            self._axis_watchers.append(_TransformWatcher(self._invalidate_conversions, ax._position, ax.viewLim, ax.transScale))
+            self._axis_watchers.append(_TransformWatcher(lambda : self._data_changed(name), ax.dataLim))
+        self._invalidate_conversions()
         return ax
     @pns.accepts(pns.Self, pns.String)
     @pns.ensures("self.is_unit(name)")
@@ -332,47 +442,7 @@ class Canvas:
         objects into Points or Vectors.
 
         """
-        if isinstance(point, Vector):
-            return self.convert_to_absolute_length(point)
-        if point.coordinate == "default":
-            return self.convert_to_absolute_coord(Point(point.x, point.y, self.default_unit))
-        if point.coordinate == "absolute":
-            return point
-        if point.coordinate == "figure":
-            return Point(point.x*self.size[0], point.y*self.size[1], "absolute")
-        if point.coordinate == "-absolute":
-            return Point(self.size[0]-point.x, self.size[1]-point.y, "absolute")
-        if point.coordinate in ["Msize", "fontsize"]: # Msize for backward compatibility
-            return self.convert_to_absolute_coord(Point(point.x*self.fontsize, point.y*self.fontsize, "point"))
-        if point.coordinate in self.axes.keys():
-            # The call to autoscale_view fix the problem that automatic data
-            # limits are updated lazily, and thus, gives an outdated transData
-            # matrix until a display function is called.
-            self.axes[point.coordinate].autoscale_view()
-            tf_data = self.axes[point.coordinate].transData
-            tf_fig = self.trans_absolute.inverted()
-            x,y = tf_fig.transform(tf_data.transform((point.x, point.y)))
-            return Point(x, y, "absolute")
-        if point.coordinate.startswith("axis_") and point.coordinate[5:] in self.axes.keys():
-            tf_ax = self.axes[point.coordinate[5:]].transAxes
-            tf_fig = self.trans_absolute.inverted()
-            x,y = tf_fig.transform(tf_ax.transform((point.x, point.y)))
-            return Point(x, y, "absolute")
-        if point.coordinate in self.units:
-            u = point.coordinate
-            return Vector(point.x*self.units[u][0], point.y*self.units[u][1], "absolute") + self.units[u][2]
-        if isinstance(point, BinopPoint):
-            # Call recursively, but handle the scalar case separately
-            if isinstance(point.lhs, Point) or isinstance(point.lhs, Vector):
-                lhs = self.convert_to_absolute_coord(point.lhs)
-            else:
-                lhs = point.lhs
-            if isinstance(point.rhs, Point) or isinstance(point.rhs, Vector):
-                rhs = self.convert_to_absolute_coord(point.rhs)
-            else:
-                rhs = point.rhs
-            return BinopPoint.op_table[point.op](lhs, rhs)
-        raise ValueError("Invalid point coordinate system %s" % point.coordinate)
+        return self._convert_to_absolute(point)
     @pns.accepts(pns.Self, Vector)
     @pns.returns(Vector)
     @pns.ensures("return.coordinate == 'absolute'")
@@ -386,22 +456,339 @@ class Canvas:
         Vectors.
 
         """
-        if vector.coordinate == "absolute":
-            return vector
-        elif isinstance(vector, BinopVector):
-            # Call recursively, but handle the scalar case separately
-            if isinstance(vector.lhs, Point) or isinstance(vector.lhs, Vector):
-                lhs = self.convert_to_absolute_coord(vector.lhs)
+        return self._convert_to_absolute(vector)
+    def _convert_to_absolute(self, point):
+        # Convert `point` (a Point or Vector) to absolute coordinates.
+        # Conversions are cached until anything they might depend on changes,
+        # which is tracked by self._version.
+        if point.coordinate == "absolute":
+            return point
+        if not self._cache_conversions:
+            return self._compute_absolute(point)
+        self._refresh_axes()
+        if self._conversion_cache_version == self._version:
+            converted = self._conversion_cache.get(point)
+            if converted is not None:
+                return converted
+        converted = self._compute_absolute(point)
+        # Computing the conversion may itself change the version, by
+        # autoscaling an axis
+        if self._conversion_cache_version != self._version:
+            self._conversion_cache.clear()
+            self._conversion_cache_version = self._version
+        self._conversion_cache.set(point, converted)
+        return converted
+    def _compute_absolute(self, point):
+        if isinstance(point, MetaBinop):
+            xy = self._affine_to_absolute(point._affine)
+            # Fall back to evaluating the tree if it isn't affine
+            x,y = xy if xy is not None else self._evaluate(point._compile())
+        else:
+            x,y = self._leaf_to_absolute(point)
+        if isinstance(point, Vector):
+            return Vector(x, y, "absolute")
+        return Point(x, y, "absolute")
+    def _invalidate_conversions(self):
+        """Mark cached conversions as outdated.
+
+        This is called automatically when units, the default unit, the
+        font size, axes, or the figure's size or dpi change.
+        """
+        self._version += 1
+    def _refresh_axes(self):
+        # Automatic data limits are updated lazily, and thus, give an outdated
+        # transData matrix until a display function is called.  So, update
+        # the limits of axes whose data coordinates we have used if
+        # necessary.  The limits also change if the autoscale settings
+        # (e.g. the margins) change.  If this changes the limits, it will
+        # invalidate the cached conversions.
+        if not self._cache_conversions:
+            return
+        # Watchers are only notified of the first change since their
+        # transforms were last read, so read them after each invalidation.
+        if self._axis_watchers_version != self._version:
+            for watcher in self._axis_watchers:
+                watcher.rearm()
+            self._axis_watchers_version = self._version
+        for name in self._autoscaled_axes:
+            ax = self.axes[name]
+            settings = _autoscale_settings(ax)
+            if settings != self._autoscale_settings[name]:
+                self._autoscale_settings[name] = settings
+                ax.autoscale_view()
+            elif any(ax._stale_viewlims.values()):
+                ax._unstale_viewLim()
+    def _autoscale_axis(self, name):
+        # The call to autoscale_view fixes the problem that automatic data
+        # limits are updated lazily, and thus, gives an outdated transData
+        # matrix until a display function is called.  This only needs to be
+        # done again when the data change, unless we can't tell when they
+        # change.
+        if not self._cache_conversions:
+            self.axes[name].autoscale_view()
+        elif name not in self._autoscaled_axes:
+            self.axes[name].autoscale_view()
+            self._autoscaled_axes.add(name)
+            self._autoscale_settings[name] = _autoscale_settings(self.axes[name])
+    def _axis_transform(self, coordinate):
+        # The transform from the data coordinates of an axis, or its "axis_"
+        # coordinates, to absolute coordinates.  Composing and inverting
+        # transforms is slow, so a frozen copy is cached until the Canvas
+        # changes.
+        if coordinate in self.axes.keys():
+            # This may itself change the version
+            self._autoscale_axis(coordinate)
+        if not self._cache_conversions:
+            self._transform_cache.clear()
+        elif self._transform_cache_version != self._version:
+            self._transform_cache.clear()
+            self._transform_cache_version = self._version
+        if coordinate not in self._transform_cache:
+            if coordinate in self.axes.keys():
+                tf = self.axes[coordinate].transData
             else:
-                lhs = vector.lhs
-            if isinstance(vector.rhs, Point) or isinstance(vector.rhs, Vector):
-                rhs = self.convert_to_absolute_coord(vector.rhs)
+                tf = self.axes[coordinate[5:]].transAxes
+            self._transform_cache[coordinate] = (tf + self.trans_absolute.inverted()).frozen()
+        return self._transform_cache[coordinate]
+    def _data_changed(self, name):
+        self._autoscaled_axes.discard(name)
+        self._invalidate_conversions()
+    def _affine_to_absolute(self, form):
+        # Evaluate an affine form (see cand.metrics), giving an (x,y) tuple in
+        # absolute coordinates, or None if it uses a coordinate system which
+        # isn't affine.
+        if form is None:
+            return None
+        (x,y),terms = form
+        for coordinate,(k,l) in terms.items():
+            params = self._affine_params(coordinate)
+            if params is None:
+                return None
+            (sx,sy),(ox,oy) = params
+            x += k[0]*sx + k[1]*sy + l[0]*ox + l[1]*oy
+            y += k[2]*sx + k[3]*sy + l[2]*ox + l[3]*oy
+        return (x, y)
+    def _affine_params(self, coordinate):
+        # The scale and origin of an affine coordinate system, such that
+        # absolute = scale*coordinate + origin, or None if it isn't affine.
+        if coordinate == "default":
+            coordinate = self.default_unit
+        if coordinate == "absolute":
+            return ((1, 1), (0, 0))
+        if coordinate == "figure":
+            return ((self.size[0], self.size[1]), (0, 0))
+        if coordinate == "-absolute":
+            return ((-1, -1), (self.size[0], self.size[1]))
+        if coordinate in ["Msize", "fontsize"]:
+            (sx,sy),origin = self._affine_params("point")
+            return ((sx*self.fontsize, sy*self.fontsize), origin)
+        if coordinate in self.axes.keys() or (coordinate.startswith("axis_") and coordinate[5:] in self.axes.keys()):
+            # Data coordinates are only affine on linear scales
+            tf = self._axis_transform(coordinate)
+            if not tf.is_affine:
+                return None
+            m = tf.get_matrix()
+            if m[0,1] != 0 or m[1,0] != 0:
+                return None
+            return ((m[0,0], m[1,1]), (m[0,2], m[1,2]))
+        if coordinate in self.units:
+            scale_x, scale_y, origin = self.units[coordinate]
+            return ((scale_x, scale_y), (origin.x, origin.y))
+        raise ValueError("Invalid point coordinate system %s" % coordinate)
+    def _evaluate(self, program, converted=None):
+        # Run a program from MetaBinop._compile, giving an (x,y) tuple in
+        # absolute coordinates.  Since everything is in the same coordinate
+        # system, each operation can be computed directly on the coordinates.
+        # Optionally, `converted` gives the leaves already converted to
+        # absolute coordinates, indexed by (is_vector, leaf).
+        registers = []
+        for op,lhs,rhs in program:
+            if op is None:
+                if converted is None:
+                    registers.append(self._leaf_to_absolute(lhs))
+                else:
+                    registers.append(converted[(isinstance(lhs, Vector), lhs)])
+                continue
+            x,y = registers[lhs]
+            if op == '+':
+                registers.append((x + registers[rhs][0], y + registers[rhs][1]))
+            elif op == '-':
+                registers.append((x - registers[rhs][0], y - registers[rhs][1]))
+            elif op == '>>':
+                registers.append((x, registers[rhs][1]))
+            elif op == '|':
+                registers.append(((x + registers[rhs][0])/2, (y + registers[rhs][1])/2))
+            elif op == '*':
+                registers.append((x * rhs, y * rhs))
+            elif op == '/':
+                registers.append((x / rhs, y / rhs))
+            elif op == '@':
+                c = math.cos(math.radians(rhs))
+                s = math.sin(math.radians(rhs))
+                registers.append((x * c - y * s, x * s + y * c))
             else:
-                rhs = vector.rhs
-            return BinopVector.op_table[vector.op](lhs, rhs)
+                raise ValueError(f"Invalid operation {op}")
+        return registers[-1]
+    def _leaf_to_absolute(self, point):
+        # Convert a Point or Vector which is not a Binop to an (x,y) tuple in
+        # absolute coordinates.
+        if isinstance(point, Vector):
+            x0,y0 = self._point_to_absolute(0, 0, point.coordinate)
+            x1,y1 = self._point_to_absolute(point.x, point.y, point.coordinate)
+            return (x1-x0, y1-y0)
+        return self._point_to_absolute(point.x, point.y, point.coordinate)
+    def _point_to_absolute(self, x, y, coordinate):
+        if coordinate == "default":
+            coordinate = self.default_unit
+        if coordinate == "absolute":
+            return (x, y)
+        if coordinate == "figure":
+            return (x*self.size[0], y*self.size[1])
+        if coordinate == "-absolute":
+            return (self.size[0]-x, self.size[1]-y)
+        if coordinate in ["Msize", "fontsize"]: # Msize for backward compatibility
+            return self._point_to_absolute(x*self.fontsize, y*self.fontsize, "point")
+        if coordinate in self.axes.keys() or (coordinate.startswith("axis_") and coordinate[5:] in self.axes.keys()):
+            return tuple(self._axis_transform(coordinate).transform((x, y)))
+        if coordinate in self.units:
+            scale_x, scale_y, origin = self.units[coordinate]
+            return (x*scale_x + origin.x, y*scale_y + origin.y)
+        raise ValueError("Invalid point coordinate system %s" % coordinate)
+    @pns.accepts(pns.Self, MetricArray)
+    @pns.returns(pns.NDArray(d=2, t=pns.Number))
+    def convert_to_absolute_array(self, points):
+        """Convert a PointArray or VectorArray to "absolute" coordinates.
+
+        Returns an N x 2 numpy array of the x and y coordinates of the
+        converted points or vectors.  All of the points are converted
+        at once, with one transformation for each coordinate system,
+        which is much faster than converting Points individually.
+
+        """
+        converted = self._convert_array_to_absolute(points)
+        return np.column_stack([converted.x, converted.y])
+    @pns.accepts(pns.Self, pns.Or(pns.List(Metric), MetricArray), pns.String)
+    @pns.returns(pns.NDArray(d=2, t=pns.Number))
+    def convert_many(self, points, to="absolute"):
+        """Convert many Points and Vectors at once.
+
+        `points` may be a list of Points and Vectors, or a PointArray
+        or VectorArray.  Returns an N x 2 numpy array of their x and y
+        coordinates in the coordinate system `to`, which may be
+        "absolute" or "figure".  Points and Vectors are grouped by
+        coordinate system, and each group is transformed at once, so
+        this is much faster than converting them individually.
+
+        """
+        if to not in ["absolute", "figure"]:
+            raise ValueError("Invalid coordinate system %s" % to)
+        if isinstance(points, PointArray) or isinstance(points, VectorArray):
+            xy = self.convert_to_absolute_array(points)
         else:
-            origin = Point(0, 0, vector.coordinate)
-            return self.convert_to_absolute_coord(origin+vector) - self.convert_to_absolute_coord(origin)
+            xy = self._convert_many_to_absolute(points)
+        if to == "figure":
+            return xy / np.asarray(self.size)
+        return xy
+    def _convert_many_to_absolute(self, points):
+        # Convert a list of Points and Vectors to an N x 2 array in absolute
+        # coordinates.  The Points and Vectors, including the leaves of
+        # Binops, are grouped by coordinate system into PointArrays and
+        # VectorArrays, and then the Binops are evaluated from the converted
+        # leaves.
+        groups = {}
+        programs = {}
+        for i,p in enumerate(points):
+            if isinstance(p, MetaBinop):
+                programs[i] = p._compile()
+                leaves = [lhs for op,lhs,_ in programs[i] if op is None]
+            else:
+                leaves = [p]
+            for leaf in leaves:
+                # A dict rather than a set, to keep the order
+                groups.setdefault((isinstance(leaf, Vector), leaf.coordinate), {})[leaf] = None
+        converted = {} # Indexed by (is_vector, leaf)
+        for (is_vector,coordinate),leaves in groups.items():
+            x = [leaf.x for leaf in leaves]
+            y = [leaf.y for leaf in leaves]
+            arr = VectorArray(x, y, coordinate) if is_vector else PointArray(x, y, coordinate)
+            arr = self._convert_array_to_absolute(arr)
+            for leaf,x,y in zip(leaves, arr.x, arr.y):
+                converted[(is_vector, leaf)] = (x, y)
+        xy = np.zeros((len(points), 2))
+        for i,p in enumerate(points):
+            if i in programs:
+                xy[i] = self._evaluate(programs[i], converted)
+            else:
+                xy[i] = converted[(isinstance(p, Vector), p)]
+        return xy
+    def _convert_array_to_absolute(self, points):
+        # Like convert_to_absolute_coord, but for PointArrays and
+        # VectorArrays.  Scalar Points and Vectors are also accepted, since
+        # they may be operands of BinopPointArrays.
+        if isinstance(points, Point) or isinstance(points, Vector):
+            return self.convert_to_absolute_coord(points)
+        if points.coordinate == "absolute":
+            return points
+        if isinstance(points, BinopPointArray) or isinstance(points, BinopVectorArray):
+            return self._evaluate_array(points, self._convert_array_leaves(points))
+        return self._convert_array_leaf(points)
+    def _convert_array_leaves(self, points):
+        # Convert all of the PointArrays and VectorArrays in the tree of the
+        # Binop array `points`, with one conversion for each coordinate
+        # system.  Returns a dict mapping the id of each leaf to its
+        # converted value.
+        groups = {}
+        stack = [points]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, BinopPointArray) or isinstance(node, BinopVectorArray):
+                stack.extend([node.lhs, node.rhs])
+            elif isinstance(node, PointArray) or isinstance(node, VectorArray):
+                groups.setdefault((isinstance(node, VectorArray), node.coordinate), []).append(node)
+        converted = {}
+        for (is_vector,coordinate),leaves in groups.items():
+            cls = VectorArray if is_vector else PointArray
+            combined = cls(np.concatenate([leaf.x for leaf in leaves]), np.concatenate([leaf.y for leaf in leaves]), coordinate)
+            combined = self._convert_array_leaf(combined)
+            splits = np.cumsum([len(leaf) for leaf in leaves])[:-1]
+            for leaf,x,y in zip(leaves, np.split(combined.x, splits), np.split(combined.y, splits)):
+                converted[id(leaf)] = cls(x, y, "absolute")
+        return converted
+    def _evaluate_array(self, node, converted):
+        # Evaluate the tree of a Binop array, given the converted leaves from
+        # _convert_array_leaves.  Scalar Points and Vectors are converted
+        # individually, since they are cached.
+        if isinstance(node, BinopPointArray) or isinstance(node, BinopVectorArray):
+            return node.op_table[node.op](self._evaluate_array(node.lhs, converted), self._evaluate_array(node.rhs, converted))
+        if isinstance(node, PointArray) or isinstance(node, VectorArray):
+            return converted[id(node)]
+        if isinstance(node, Point) or isinstance(node, Vector):
+            return self.convert_to_absolute_coord(node)
+        return node # A scalar operand, e.g. for multiplication
+    def _convert_array_leaf(self, points):
+        # Convert a PointArray or VectorArray which is not a Binop.
+        if points.coordinate == "absolute":
+            return points
+        if isinstance(points, VectorArray):
+            origin = Point(0, 0, points.coordinate)
+            return self._convert_array_to_absolute(origin + points) - self.convert_to_absolute_coord(origin)
+        x,y = points.x, points.y
+        if points.coordinate == "default":
+            return self._convert_array_to_absolute(PointArray(x, y, self.default_unit))
+        if points.coordinate == "figure":
+            return PointArray(x*self.size[0], y*self.size[1], "absolute")
+        if points.coordinate == "-absolute":
+            return PointArray(self.size[0]-x, self.size[1]-y, "absolute")
+        if points.coordinate in ["Msize", "fontsize"]:
+            return self._convert_array_to_absolute(PointArray(x*self.fontsize, y*self.fontsize, "point"))
+        if points.coordinate in self.axes.keys() or (points.coordinate.startswith("axis_") and points.coordinate[5:] in self.axes.keys()):
+            self._refresh_axes()
+            xy = self._axis_transform(points.coordinate).transform(np.column_stack([x, y]))
+            return PointArray(xy[:,0], xy[:,1], "absolute")
+        if points.coordinate in self.units:
+            scale_x, scale_y, origin = self.units[points.coordinate]
+            return PointArray(x*scale_x + origin.x, y*scale_y + origin.y, "absolute")
+        raise ValueError("Invalid point coordinate system %s" % points.coordinate)
     @pns.accepts(pns.Self, Metric)
     @pns.returns(Metric)
     @pns.ensures("return.coordinate == 'figure'")
@@ -418,19 +805,70 @@ class Canvas:
         """Converts units in a Vector to "figure"."""
         v = self.convert_to_absolute_length(vec)
         return Vector(v.x / self.size[0], v.y / self.size[1], "figure")
-    @pns.accepts(pns.Self, pns.List(Point))
+    @pns.accepts(pns.Self, pns.Or(Metric, MetricArray), pns.String)
+    @pns.returns(pns.Or(Metric, MetricArray))
+    @pns.ensures("return.coordinate == coordinate")
+    def convert_from_absolute(self, points, coordinate):
+        """Convert Points or Vectors to the coordinate system `coordinate`.
+
+        This is the inverse of convert_to_absolute_coord.  `points` may
+        be a Point or Vector, or a PointArray or VectorArray to convert
+        many at once, in any coordinate system.  `coordinate` may be
+        any unit, the name of an axis (for its data coordinates), or
+        "axis_" followed by the name of an axis.  Returns the same
+        type as `points`.
+
+        """
+        if isinstance(points, PointArray) or isinstance(points, VectorArray):
+            xy = self.convert_to_absolute_array(points)
+        else:
+            p = self.convert_to_absolute_coord(points)
+            xy = np.asarray([[p.x, p.y]])
+        is_vector = isinstance(points, Vector) or isinstance(points, VectorArray)
+        if is_vector:
+            # Vectors are differences from the origin of the coordinate system
+            origin = self.convert_to_absolute_coord(Point(0, 0, coordinate))
+            xy = xy + [origin.x, origin.y]
+        xy = self._inverse_transform(coordinate).transform(xy)
+        if isinstance(points, PointArray):
+            return PointArray(xy[:,0], xy[:,1], coordinate)
+        if isinstance(points, VectorArray):
+            return VectorArray(xy[:,0], xy[:,1], coordinate)
+        if is_vector:
+            return Vector(xy[0,0], xy[0,1], coordinate)
+        return Point(xy[0,0], xy[0,1], coordinate)
+    def _inverse_transform(self, coordinate):
+        # The transform from absolute coordinates to the coordinate system
+        # `coordinate`.  These are cached alongside the axis transforms.
+        name = self.default_unit if coordinate == "default" else coordinate
+        if name in self.axes.keys():
+            # This may itself change the version
+            self._autoscale_axis(name)
+        if not self._cache_conversions:
+            self._transform_cache.clear()
+        elif self._transform_cache_version != self._version:
+            self._transform_cache.clear()
+            self._transform_cache_version = self._version
+        key = ("inverse", name)
+        if key not in self._transform_cache:
+            params = self._affine_params(name)
+            if params is None:
+                tf = self._axis_transform(name).inverted()
+            else:
+                (sx,sy),(ox,oy) = params
+                tf = matplotlib.transforms.Affine2D.from_values(sx, 0, 0, sy, ox, oy).inverted()
+            self._transform_cache[key] = tf
+        return self._transform_cache[key]
+    @pns.accepts(pns.Self, pns.Or(pns.List(Point), MetricArray))
     def add_poly(self, points, **kwargs):
         """Draw a polygon with given vertices.
 
-        Vertices are passed as a list of Point objects via the
-        `points` argument.  All other keyword arguments are passed
-        directly to matplotlib.patches.Polygon.
+        Vertices are passed as a list of Point objects, or as a
+        PointArray, via the `points` argument.  All other keyword
+        arguments are passed directly to matplotlib.patches.Polygon.
 
         """
-        np_points = np.zeros((len(points), 2))
-        for i,p in enumerate(points):
-            pt = self.convert_to_absolute_coord(p)
-            np_points[i] = [pt.x, pt.y]
+        np_points = self.convert_many(points)
         if "fill" not in kwargs.keys():
             kwargs['fill'] = False
         poly = matplotlib.patches.Polygon(np_points, transform=self.trans_absolute, **kwargs)
@@ -553,6 +991,50 @@ class Canvas:
                                 opticalsize=opticalsize, monospace=monospace)
         self.figure.text(pt.x, pt.y, text, transform=self.trans_absolute,
                          fontproperties=fprops, fontsize=size, **kwargs)
+    def text_size(self, text, font=None, size=None, weight=None, style=None, stretch=None, foundry=None, special=None, opticalsize=None, monospace=None, **kwargs):
+        """Find the size of text without drawing it.
+
+        Returns a Vector in absolute units giving the width and height of
+        the bounding box of `text`, as it would be drawn by add_text with
+        the same arguments.  Font arguments are the same as add_text.
+        Other keyword arguments which affect the layout of the text, such
+        as `rotation` or `linespacing`, are passed to matplotlib.text.Text.
+
+        Measurements are cached, so this is fast enough to call for every
+        label in a layout.  Note that text is measured with matplotlib's
+        renderer even when use_latex is enabled, so sizes for latex text
+        are approximate.
+        """
+        global _text_renderer, _text_figure
+        if size is None:
+            size = self.fontsize
+        if 'fontname' in kwargs.keys() and font is None:
+            font = kwargs.pop('fontname')
+        fprops = self._get_font(name=font, weight=weight, size=size,
+                                stretch=stretch, style=style, foundry=foundry, special=special,
+                                opticalsize=opticalsize, monospace=monospace)
+        key = (text, fprops.get_file(), size, _freeze(kwargs))
+        # Math text also depends on the math fonts, which are set in the rc
+        if "$" in text:
+            key += tuple(sorted((k,v) for k,v in self.localRc.items() if k.startswith("mathtext.")))
+        try:
+            extent = _text_size_cache.get(key)
+        except TypeError: # Unhashable arguments, so don't use the cache
+            key = None
+            extent = None
+        if extent is None:
+            from matplotlib.backends.backend_agg import RendererAgg
+            with _text_renderer_lock, matplotlib.rc_context(rc=self.localRc):
+                if _text_renderer is None:
+                    _text_renderer = RendererAgg(1, 1, 72)
+                    _text_figure = matplotlib.figure.Figure(dpi=72)
+                t = matplotlib.text.Text(0, 0, text, fontproperties=fprops, **kwargs)
+                t.set_figure(_text_figure)
+                bbox = t.get_window_extent(_text_renderer)
+            extent = (float(bbox.width)/72, float(bbox.height)/72)
+            if key is not None:
+                _text_size_cache.set(key, extent)
+        return Vector(extent[0], extent[1], "absolute")
     def add_line(self, frm, to, **kwargs):
         """Draw a line.
 
@@ -597,7 +1079,6 @@ class Canvas:
         """
         if fontsize is None:
             fontsize = self.fontsize
-        pos_tl = self.convert_to_absolute_coord(pos_tl)
         assert len(els) >= 1
         # Get the text height
         fprops = self._get_font()
@@ -605,11 +1086,9 @@ class Canvas:
         padding_top = Height(0, "Msize") # Space on top of figure
         padding_left = Width(0, "Msize") # Space on left of lines
         # Convert these to an easier coordinate system
-        padding_top = self.convert_to_absolute_length(padding_top)
-        padding_left = self.convert_to_absolute_length(padding_left)
-        padding_sep = self.convert_to_absolute_length(padding_sep)
-        line_spacing = self.convert_to_absolute_length(line_spacing)
-        sym_width = self.convert_to_absolute_length(sym_width)
+        converted = self.convert_many([pos_tl, padding_top, padding_left, padding_sep, line_spacing, sym_width])
+        pos_tl = Point(*converted[0], "absolute")
+        padding_top,padding_left,padding_sep,line_spacing,sym_width = [Vector(*xy, "absolute") for xy in converted[1:]]
         top_left = pos_tl - padding_top + padding_left
         for i in range(0, len(els)):
             # Figure out the vertical position of this element of the legend
@@ -752,10 +1231,18 @@ class Canvas:
             size_x = size.width()
             size_y = size.height()
         ncols = len(names)//nrows + int(len(names) % nrows != 0)
-        pt_ll = self.convert_to_absolute_coord(pos_ll)
-        pt_ur = self.convert_to_absolute_coord(pos_ur)
+        # Convert everything which was given to absolute coordinates at once
+        lengths = {"size_x": size_x, "size_y": size_y, "spacing_x": spacing_x, "spacing_y": spacing_y}
+        lengths = {k : v for k,v in lengths.items() if v is not None}
+        converted = self.convert_many([pos_ll, pos_ur] + list(lengths.values()))
+        pt_ll = Point(*converted[0], "absolute")
+        pt_ur = Point(*converted[1], "absolute")
+        lengths = {k : Vector(*xy, "absolute") for k,xy in zip(lengths.keys(), converted[2:])}
+        size_x = lengths.get("size_x")
+        size_y = lengths.get("size_y")
+        spacing_x = lengths.get("spacing_x")
+        spacing_y = lengths.get("spacing_y")
         if size_x is not None:
-            size_x = self.convert_to_absolute_length(size_x)
             if ncols > 1:
                 spacing_x = ((pt_ur - pt_ll).width() - size_x * ncols)/(ncols-1)
             elif ncols == 1:
@@ -764,7 +1251,6 @@ class Canvas:
                 pt_ll = pt_ll + (w - size_x)/2
                 pt_ur = pt_ur - (w - size_x)/2
         if size_y is not None:
-            size_y = self.convert_to_absolute_length(size_y)
             if nrows > 1:
                 spacing_y = ((pt_ur - pt_ll).height() - size_y * nrows)/(nrows-1)
             elif nrows == 1:
@@ -772,8 +1258,6 @@ class Canvas:
                 h = (pt_ur-pt_ll).height()
                 pt_ll = pt_ll + (h - size_y)/2
                 pt_ur = pt_ur - (h - size_y)/2
-        spacing_x = self.convert_to_absolute_length(spacing_x)
-        spacing_y = self.convert_to_absolute_length(spacing_y)
         posx = self._grid_space(pt_ll.x, pt_ur.x, spacing_x.x, ncols)
         posy = list(reversed(self._grid_space(pt_ll.y, pt_ur.y, spacing_y.y, nrows)))
         for i in range(0, len(names)):
@@ -785,6 +1269,22 @@ class Canvas:
             assert self.is_valid_identifier(unitname), f"Invalid axis name {unitname!r}"
             self.add_unit(unitname, (pt_ur-pt_ll), pt_ll)
 
+    def _composite_images(self, img):
+        # Draw the images added with add_image onto the PIL image `img` of the
+        # whole figure
+        imwidth = img.size[0]
+        imheight = img.size[1]
+        for image in self.images:
+            pos_ll = image[1]
+            pos_ur = image[2]
+            bounds = (int(imwidth*pos_ll.x), int(imheight*(1-pos_ur.y)), int(imwidth*pos_ur.x), int(imheight*(1-pos_ll.y)))
+            subimg_size = (bounds[2]-bounds[0], bounds[3]-bounds[1])
+            if image[0].endswith(".pdf"):
+                # Render pdfs directly at their final size
+                subimg = raster.rasterize_pdf(image[0], subimg_size)
+            else:
+                subimg = raster.resample_image(image[0], subimg_size)
+            img.alpha_composite(subimg, bounds[0:2])
     @pns.accepts(pns.Self, pns.String, pns.Maybe(pns.Natural1))
     def save(self, filename, dpi=600, *args, **kwargs):
         """Save the Canvas to a png or pdf file.
@@ -815,35 +1315,33 @@ class Canvas:
         elif self.backend == "default":
             from matplotlib.backends.backend_agg import FigureCanvasAgg
             mplcanvas = FigureCanvasAgg(self.figure)
+        if filetype == "png" and self.backend == "default":
+            # Composite the images onto the rendered figure in memory, so the
+            # png only needs to be encoded once.
+            metadata = kwargs.pop("metadata", None) or {}
+            pil_kwargs = kwargs.pop("pil_kwargs", None) or {}
+            with matplotlib.rc_context(rc=self.localRc):
+                self.figure.savefig(_NullWriter(), dpi=dpi, format="raw", *args, **kwargs)
+            buf = mplcanvas.buffer_rgba()
+            img = Image.frombuffer("RGBA", (buf.shape[1], buf.shape[0]), buf, "raw", "RGBA", 0, 1)
+            self._composite_images(img)
+            imgtext = {"Software": f"Matplotlib version{matplotlib.__version__}, https://matplotlib.org/", **metadata}
+            imgtext["Software"] = f"{_idstr}; {imgtext['Software']}"
+            newmeta = PngImagePlugin.PngInfo()
+            for k,v in imgtext.items():
+                newmeta.add_text(k, v)
+            pil_kwargs.setdefault("pnginfo", newmeta)
+            if dpi is not None:
+                pil_kwargs.setdefault("dpi", (dpi, dpi))
+            img.save(filename, format="png", **pil_kwargs)
+            return
         with matplotlib.rc_context(rc=self.localRc):
             self.figure.savefig(filename, dpi=dpi, *args, **kwargs)
         if filetype == "png":
             with Image.open(filename) as img:
                 imgtext = img.text
                 img = img.convert('RGBA')
-                for image in self.images:
-                    if image[0].endswith(".pdf"): # Convert pdf to png first
-                        pdf = mupdf.open(image[0])
-                        page = pdf[0]
-                        imgpath = tempfile.mkstemp('.png')[1]
-                        zoom = int(np.ceil(dpi/72)) if dpi else 1
-                        try:
-                            page.getPixmap(alpha=True, matrix=mupdf.Matrix(zoom, zoom)).writeImage(imgpath)
-                        except AttributeError:
-                            page.get_pixmap(alpha=True, matrix=mupdf.Matrix(zoom, zoom)).save(imgpath)
-                    else:
-                        imgpath = image[0]
-                    with Image.open(imgpath) as subimg:
-                        subimg = subimg.convert('RGBA')
-                        imwidth = img.size[0]
-                        imheight = img.size[1]
-                        pos_ll = image[1]
-                        pos_ur = image[2]
-                        # subimg.thumbnail(size)
-                        bounds = (int(imwidth*pos_ll.x), int(imheight*(1-pos_ur.y)), int(imwidth*pos_ur.x), int(imheight*(1-pos_ll.y)))
-                        subimg_size = (bounds[2]-bounds[0], bounds[3]-bounds[1])
-                        subimg = subimg.resize(subimg_size, Image.LANCZOS)
-                        img.alpha_composite(subimg, bounds[0:2])
+                self._composite_images(img)
                 existing_meta = ("; "+imgtext['Software']) if 'Software' in imgtext.keys() else ""
                 imgtext["Software"] = f"{_idstr}{existing_meta}"
                 newmeta = PngImagePlugin.PngInfo()
@@ -893,42 +1391,56 @@ class Canvas:
         Optionally, it begins this grid at the Point `origin`.
 
         """
-        bottom_left = Point(0, 0, "figure")
-        top_right = Point(1, 1, "figure")
         args = {"zorder": 100, "alpha": .2, "c": "k"}
         args.update(kwargs)
-        i = 0
-        while True:
-            xpos = i*spacing.width() + origin
-            if self.convert_to_figure_coord(xpos).x >= 0:
-                self.add_line(xpos >> bottom_left, xpos >> top_right, **args)
-            else:
-                break
-            i -= 1
-        i = 0
-        while True:
-            xpos = i*spacing.width() + origin
-            if self.convert_to_figure_coord(xpos).x <= 1:
+        if not all(self._affine_to_absolute(_affine_form(v)) is not None for v in [origin, spacing]):
+            # The grid lines are not evenly spaced on the figure if they are
+            # on a nonlinear (e.g. log) axis, so find each one separately.
+            self._debug_grid_nonlinear(spacing, origin, args)
+            return
+        # Find the grid lines in figure coordinates, starting at the origin
+        # and moving outward in each direction until we leave the figure.
+        (ox,oy),(sx,_),(_,sy) = self.convert_many([origin, spacing.width(), spacing.height()], to="figure")
+        if sx <= 0 or sy <= 0:
+            raise ValueError("Grid spacing must be positive")
+        def positions(start, step):
+            pos = []
+            i = 0
+            while start + i*step >= 0:
+                pos.append(start + i*step)
+                i -= 1
+            i = 0
+            while start + i*step <= 1:
+                pos.append(start + i*step)
+                i += 1
+            return pos
+        for x in positions(ox, sx):
+            self.add_line(Point(x, 0, "figure"), Point(x, 1, "figure"), **args)
+        for y in positions(oy, sy):
+            self.add_line(Point(0, y, "figure"), Point(1, y, "figure"), **args)
+    def _debug_grid_nonlinear(self, spacing, origin, args):
+        # Draw the lines for debug_grid one at a time, starting at the origin
+        # and moving outward in each direction until we leave the figure.
+        bottom_left = Point(0, 0, "figure")
+        top_right = Point(1, 1, "figure")
+        for step in [-1, 1]:
+            i = 0
+            while True:
+                xpos = i*spacing.width() + origin
+                x = self.convert_to_figure_coord(xpos).x
+                if not (x >= 0 if step < 0 else x <= 1):
+                    break
                 self.add_line(xpos >> bottom_left, xpos >> top_right, **args)
-            else:
-                break
-            i += 1
-        i = 0
-        while True:
-            ypos = i*spacing.height() + origin
-            if self.convert_to_figure_coord(ypos).y >= 0:
+                i += step
+        for step in [-1, 1]:
+            i = 0
+            while True:
+                ypos = i*spacing.height() + origin
+                y = self.convert_to_figure_coord(ypos).y
+                if not (y >= 0 if step < 0 else y <= 1):
+                    break
                 self.add_line(bottom_left >> ypos, top_right >> ypos, **args)
-            else:
-                break
-            i -= 1
-        i = 0
-        while True:
-            ypos = i*spacing.height() + origin
-            if self.convert_to_figure_coord(ypos).y <= 1:
-                self.add_line(bottom_left >> ypos, top_right >> ypos, **args)
-            else:
-                break
-            i += 1
+                i += step
 
     def add_image(self, filename, pos, unitname=None, height=None, width=None, horizontalalignment=None, verticalalignment=None, ha=None, va=None):
         """Add a png or pdf image to the Canvas.
@@ -959,15 +1471,7 @@ class Canvas:
             verticalalignment = va if va is not None else "center"
         pos_ll = self.convert_to_figure_coord(pos)
         assert height is not None or width is not None, "Either height or width must be given"
-        if filename.endswith(".pdf"):
-            pdf = mupdf.open(filename)
-            page = pdf[0]
-            imwidth = page.bound().width
-            imheight = page.bound().height
-        else:
-            with Image.open(filename) as img:
-                imwidth = img.size[0]
-                imheight = img.size[1]
+        imwidth,imheight = raster.image_size(filename)
         if width is None:
             height = self.convert_to_figure_length(height.height())
             width = Width(height.y * (self.size[1]/self.size[0]) * (imwidth/imheight), "figure")
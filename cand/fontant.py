@@ -2,7 +2,16 @@
 import matplotlib
 from matplotlib.font_manager import findSystemFonts
 from matplotlib import ft2font
+import bisect
+import concurrent.futures
+import json
+import multiprocessing
 import os
+import sys
+import tempfile
+from ._version import __version__
+from .sfnt import SfntFont, SfntError
+from .cache import LRUCache
 
 def get_fonts():
     # Get default matplotlib paths
@@ -164,6 +173,16 @@ FOUNDRIES_NAME = {
 OPTICAL_SIZES = ["display", "caption", "subhead", "re",
                  "text", "headline", "banner", "micro", "deck"]
 
+# FreeType's style and face flags.  Newer versions of matplotlib expose these
+# as enums, so we convert them to plain integers (see _flags) in order to store
+# them in the font index.
+STYLE_ITALIC = 1
+STYLE_BOLD = 2
+FACE_FIXED_WIDTH = 4
+
+def _flags(flags):
+    return int(getattr(flags, "value", flags))
+
 def get_property(font, props):
     PROPS = {
         "ps_notice": ("ps", 1), # Copyright notice
@@ -267,7 +286,7 @@ def get_style(font):
             if style in familyname.lower().replace("-", " ").split(" "):
                 return style
     # Now check properties of the font
-    if font.style_flags & ft2font.ITALIC:
+    if _flags(font.style_flags) & STYLE_ITALIC:
         return "italic"
     # if get_property(font, "ps_italicangle") != 0:
     #     return "italic"
@@ -280,7 +299,7 @@ def get_monospace(font):
     if ismono is not None:
         return bool(ismono)
     # If not, use the font object
-    return bool(font.face_flags & ft2font.FIXED_WIDTH)
+    return bool(_flags(font.face_flags) & FACE_FIXED_WIDTH)
     # # If not, let's render two characters that should be different widths.  If
     # # they are the same width, we can assume the font is monospace.
     # font.set_text(".")
@@ -370,7 +389,7 @@ def get_weight(font):
     if weight:
         return weight.lower()
     # As a last ditch, look at flags
-    if font.style_flags & ft2font.BOLD:
+    if _flags(font.style_flags) & STYLE_BOLD:
         return "bold"
     return "regular"
 
@@ -399,8 +418,22 @@ def get_special(font):
 def get_version(font):
     return get_property(font, "sfnt_version")
 
+def get_coverage(font):
+    # The characters with glyphs in the font, as a sorted list of [first,
+    # last] codepoint ranges, which is much more compact than a list of
+    # characters or a bitmap.
+    if hasattr(font, "get_coverage"): # Faster for SfntFont
+        return font.get_coverage()
+    ranges = []
+    for c in sorted(font.get_charmap().keys()):
+        if ranges and ranges[-1][1] == c-1:
+            ranges[-1][1] = c
+        else:
+            ranges.append([c, c])
+    return ranges
+
 def get_base_style(font):
-    base_style = font.style_flags
+    base_style = _flags(font.style_flags)
     # Sometimes italic/bold versions are mistakenly detected as base_style 0.
     if base_style == 0:
         if get_weight(font) == "bold":
@@ -410,10 +443,16 @@ def get_base_style(font):
     return base_style
 
 def loadttf(path):
+    # Read the font's tables directly if possible, since this is much faster
+    # than loading it with FreeType.  FreeType is only used for fonts which
+    # the sfnt reader does not support.
     try:
-        font = ft2font.FT2Font(path)
-    except RuntimeError:
-        return None
+        font = SfntFont(path)
+    except SfntError:
+        try:
+            font = ft2font.FT2Font(path)
+        except RuntimeError:
+            return None
     props = {
         "fname": font.fname,
         "full_name": get_fullname(font),
@@ -431,81 +470,397 @@ def loadttf(path):
         "special": get_special(font),
         "num_faces": font.num_faces,
         "base_style": get_base_style(font), # 0 = regular, 1 = italic, 2 = bold, 3 = bolditalic
+        "coverage": get_coverage(font),
     }
     return props
 
+# The font index is a persistent cache of the output of loadttf for each font
+# on the system, so that we don't need to open every font file with FreeType
+# each time a new process searches for a font.  It is stored as a json file,
+# mapping each font path to the path's mtime and size at the time it was
+# loaded and the output of loadttf.  Fonts which are added, removed, or
+# modified are updated the next time the index is loaded.  Increment
+# INDEX_VERSION whenever the format of the index or the output of loadttf
+# changes.
+INDEX_VERSION = 2
+
+_font_list = None
+_font_catalog = None
+_bundled_font_catalog = None
+
+def get_cache_dir():
+    """Directory used by CanD to store persistent caches.
+
+    This can be overridden by the CAND_CACHE_DIR environment variable.
+    """
+    if os.environ.get("CAND_CACHE_DIR"):
+        return os.environ["CAND_CACHE_DIR"]
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+    elif sys.platform == "darwin":
+        base = os.path.join(os.path.expanduser("~"), "Library", "Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "cand")
+
+def get_index_path():
+    return os.path.join(get_cache_dir(), "fontindex.json")
+
+def _read_index():
+    try:
+        with open(get_index_path(), "r") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(index, dict) or index.get("version") != INDEX_VERSION or \
+       index.get("cand_version") != __version__:
+        return {}
+    return index.get("fonts", {})
+
+def _write_index(entries):
+    path = get_index_path()
+    index = {"version": INDEX_VERSION, "cand_version": __version__, "fonts": entries}
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so that concurrent processes never
+        # see a partially-written index.
+        fd, tmppath = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(index, f)
+            # mkstemp makes the file readable only by its owner, but an index
+            # built by one user (e.g. when building an image) may be used by
+            # others, so give it the usual permissions for a new file.
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmppath, 0o666 & ~umask)
+            os.replace(tmppath, path)
+        except BaseException:
+            os.remove(tmppath)
+            raise
+    except (OSError, TypeError, ValueError) as e:
+        print(f"Warning: could not save the font index to {path}: {e}")
+
+def _loadttf_many(paths):
+    # Worker for scan_fonts.  Exceptions are caught per font so that one bad
+    # font does not discard the rest of the shard.
+    props = []
+    for path in paths:
+        try:
+            props.append(loadttf(path))
+        except Exception:
+            props.append(None)
+    return props
+
+# Flags which workers in scan_fonts set when they start loading a shard, so
+# that if a worker crashes, we know which shards may have caused it.
+_shards_started = None
+
+def _init_scan_worker(started):
+    global _shards_started
+    _shards_started = started
+
+def _loadttf_shard(index, paths):
+    # Worker for scan_fonts, loading the shard with the given index
+    _shards_started[index] = 1
+    return _loadttf_many(paths)
+
+def _loadttf_isolated(paths):
+    # Run loadttf on each of `paths` in its own worker process, so that a
+    # font which crashes its worker cannot affect any other font.
+    results = {}
+    for path in paths:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1) as pool:
+            try:
+                results[path] = pool.submit(_loadttf_many, [path]).result()[0]
+            except Exception:
+                print(f"Warning: font {path} could not be loaded")
+                results[path] = None
+    return results
+
+def scan_fonts(paths, processes=None):
+    """Run loadttf on each of `paths`, optionally in parallel.
+
+    If `processes` is greater than 1, the paths are split into shards
+    which are loaded in a pool of `processes` worker processes.  If a
+    font crashes the worker loading it, the unfinished shards are
+    retried in a new pool, with the shards which were being loaded at
+    the time split in half, until the font which crashed is found and
+    skipped.  By default, `processes` is taken from the
+    CAND_FONT_SCAN_PROCESSES environment variable, or 1 if it is not
+    set.  Returns a dict mapping each path to the output of loadttf.
+    """
+    if processes is None:
+        processes = int(os.environ.get("CAND_FONT_SCAN_PROCESSES", 1))
+    if processes <= 1 or len(paths) <= 1:
+        return dict(zip(paths, _loadttf_many(paths)))
+    # Use several shards per process to balance the load, since some font
+    # files are much slower to load than others.
+    nshards = min(len(paths), processes*4)
+    shards = [paths[i::nshards] for i in range(0, nshards)]
+    results = {}
+    suspects = []
+    while shards:
+        started = multiprocessing.RawArray("b", len(shards))
+        retry = []
+        with concurrent.futures.ProcessPoolExecutor(max_workers=processes, initializer=_init_scan_worker,
+                                                    initargs=(started,)) as pool:
+            futures = [pool.submit(_loadttf_shard, i, shard) for i,shard in enumerate(shards)]
+            for i,(future,shard) in enumerate(zip(futures, shards)):
+                try:
+                    results.update(zip(shard, future.result()))
+                except Exception:
+                    # A worker died, e.g. from a segfault in FreeType, which
+                    # breaks the whole pool.  Shards which hadn't started
+                    # can't have caused it, so retry them as they are.
+                    if not started[i]:
+                        retry.append(shard)
+                    elif len(shard) == 1:
+                        suspects.extend(shard)
+                    else:
+                        retry.extend([shard[:len(shard)//2], shard[len(shard)//2:]])
+        shards = retry
+    # Fonts which were being loaded alone when a worker died may still have
+    # been loaded by a different worker, so check each in its own process.
+    results.update(_loadttf_isolated(suspects))
+    return results
+
+def build_font_index(rebuild=False, processes=None):
+    """Update the font index and return the properties of all system fonts.
+
+    Fonts whose path, mtime, and size match an entry in the on-disk
+    index are not reloaded.  If `rebuild` is True, ignore the existing
+    index and load every font from scratch.  Fonts which need to be
+    loaded are passed to scan_fonts along with `processes`.  Returns a
+    list of dicts, as returned by loadttf.
+    """
+    global _font_list, _font_catalog
+    entries = {} if rebuild else _read_index()
+    newentries = {}
+    toload = []
+    for path in get_fonts():
+        if path in newentries:
+            continue
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entry = entries.get(path)
+        if entry is None or entry.get("mtime") != st.st_mtime_ns or entry.get("size") != st.st_size:
+            entry = {"mtime": st.st_mtime_ns, "size": st.st_size, "props": None}
+            toload.append(path)
+        newentries[path] = entry
+    for path,props in scan_fonts(toload, processes=processes).items():
+        newentries[path]["props"] = props
+    if toload or newentries.keys() != entries.keys():
+        _write_index(newentries)
+    _font_list = [e["props"] for e in newentries.values() if e["props"] is not None]
+    _font_catalog = None
+    return _font_list
+
+def get_indexed_fonts():
+    """Return the properties of all system fonts, using the font index.
+
+    The index is only checked for changes the first time this is called in
+    each process.  Call build_font_index to check again.
+    """
+    if _font_list is None:
+        return build_font_index()
+    return _font_list
+
 class NoFontFoundError(ValueError):
     pass
 
 class MultipleFontsFoundError(ValueError):
     pass
 
-_find_font_cache = {}
+def _lower(x):
+    return x.lower() if isinstance(x, str) else x
 
-def find_font(name, *, weight=None, style=None, stretch=None, opticalsize=None, monospace=None, foundry=None, special=None, multiple=False):
-    global _find_font_cache
-    cachename = (name, weight, style, stretch, opticalsize, monospace, foundry, special, multiple)
-    if cachename in _find_font_cache.keys():
-        return _find_font_cache[cachename]
-    # Check if they passed a filename for the name.  If so, return that.
-    if name is not None and os.path.isfile(name):
-        loadedttf = loadttf(name)
-        if loadedttf is None:
-            print(f"Warning: font path {name} could not be loaded, trying a more thorough search")
-        else:
-            _find_font_cache[cachename] = loadedttf
-            return loadedttf
-    # If not, firs, find all fonts which contain the specified name as a
-    # substring.  This first expression uses the "for lf in [...]" hack like a
-    # "let" statement in lisp so that we can still use list comprehensions and
-    # filter for None without running the loadttf function twice.  (I think
-    # there might be special syntax for this in newer versions of Python?)
-    fonts = [lf for p in get_fonts() for lf in [loadttf(p)] if lf is not None]
-    fonts = [f for f in fonts if name.lower() in f["full_name"].lower() or
-                                 name.lower() in f["family_name"].lower() or
-                                 name.lower() in f["postscript_name"].lower()]
-    if len(fonts) == 0:
-        raise NoFontFoundError("Invalid font name")
-    # Next, try to narrow it down based on family name.
-    _fonts = [f for f in fonts if name.lower() in f["family_name"].lower()]
-    fonts = _fonts or fonts
-    # Next, check if there is an exact match in full name, family name, or postscript name
-    _fonts = [f for f in fonts if name.lower() in [f["family_name"].lower(),
-                                                   f["full_name"].lower(),
-                                                   f["postscript_name"].lower()]]
-    fonts = _fonts or fonts
-    # Now we filter by each of the properties which was passed as an argument
-    def filter_if_exists(fonts, prop, val):
-        lower = lambda x : x.lower() if isinstance(x, str) else x
+class FontCatalog:
+    """An index of font properties, used to search for fonts by name.
+
+    `fonts` is a list of dicts as returned by loadttf.  Fonts are
+    referred to by their index in this list.  To find fonts whose
+    full, family, or postscript name contains a given substring
+    without checking every font, we keep an index of the trigrams
+    which appear in each name.  Fonts are also grouped into buckets by
+    the value of each of the properties that may be passed to
+    find_font.
+    """
+    NGRAM = 3
+    PROPERTIES = ["weight", "weight_number", "stretch", "monospace",
+                  "opticalsize", "foundry", "special", "style"]
+    def __init__(self, fonts):
+        self.fonts = list(fonts)
+        self.names = [(f["family_name"].lower(), f["full_name"].lower(), f["postscript_name"].lower())
+                      for f in self.fonts]
+        self.families = set(names[0] for names in self.names)
+        self.ngrams = {}
+        self.buckets = {prop: {} for prop in self.PROPERTIES}
+        for i,(f,names) in enumerate(zip(self.fonts, self.names)):
+            for name in set(names):
+                for j in range(0, len(name)-self.NGRAM+1):
+                    self.ngrams.setdefault(name[j:j+self.NGRAM], set()).add(i)
+            for prop in self.PROPERTIES:
+                self.buckets[prop].setdefault(_lower(f[prop]), set()).add(i)
+    def has_family(self, name):
+        """Whether any font has the family name `name` (case insensitive)."""
+        return name.lower() in self.families
+    def candidates(self, name):
+        """Fonts which may contain `name` in one of their names."""
+        if len(name) < self.NGRAM:
+            return range(0, len(self.fonts))
+        ngrams = set(name[j:j+self.NGRAM] for j in range(0, len(name)-self.NGRAM+1))
+        postings = sorted((self.ngrams.get(ng, set()) for ng in ngrams), key=len)
+        return set.intersection(*postings)
+    def match_name(self, name):
+        """Find the fonts which best match the name `name`.
+
+        Only fonts which contain `name` as a substring of their full,
+        family, or postscript name are considered.  If any of these
+        contain it in their family name, only these are kept.  Of the
+        remaining, if any match `name` exactly, only these are kept.
+        Returns a set of font indices.
+        """
+        name = name.lower()
+        best = None
+        matches = set()
+        for i in self.candidates(name):
+            family,full,ps = self.names[i]
+            in_family = name in family
+            if not (in_family or name in full or name in ps):
+                continue
+            score = (in_family, name in (family, full, ps))
+            if best is None or score > best:
+                best = score
+                matches = {i}
+            elif score == best:
+                matches.add(i)
+        return matches
+    def filter_if_exists(self, ids, prop, val):
+        """Keep only the fonts in `ids` with property `prop` equal to `val`.
+
+        Raises NoFontFoundError, listing the valid options, if none of
+        the fonts have this value.
+        """
         if val is None:
-            return fonts
-        allprops = set(lower(f[prop]) for f in fonts)
-        if lower(val) in allprops:
-            return [f for f in fonts if lower(val) == lower(f[prop])]
-        else:
-            errortext = f"No selected fonts have {prop} = \"{val}\", options are:\n    "
-            errortext += ", ".join(f'"{p}"' for p in sorted(allprops))
-            raise NoFontFoundError(errortext)
+            return ids
+        matching = ids & self.buckets[prop].get(_lower(val), set())
+        if matching:
+            return matching
+        allprops = set(_lower(self.fonts[i][prop]) for i in ids)
+        errortext = f"No selected fonts have {prop} = \"{val}\", options are:\n    "
+        errortext += ", ".join(f'"{p}"' for p in sorted(allprops))
+        raise NoFontFoundError(errortext)
+
+def get_bundled_font_catalog():
+    """Return a FontCatalog of the ttf fonts distributed with matplotlib.
+
+    These are taken from the font index if it is up to date, and are
+    otherwise loaded directly, which is fast because there are only a
+    few of them.  The index is not updated, so the system fonts are
+    never scanned.
+    """
+    global _bundled_font_catalog
+    if _bundled_font_catalog is None:
+        path = os.path.join(matplotlib.get_data_path(), 'fonts', 'ttf')
+        index = _read_index()
+        fonts = []
+        for p in sorted(findSystemFonts([path], fontext="ttf")):
+            entry = index.get(p)
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            if entry is not None and entry.get("mtime") == st.st_mtime_ns and entry.get("size") == st.st_size:
+                props = entry["props"]
+            else:
+                props = loadttf(p)
+            if props is not None:
+                fonts.append(props)
+        _bundled_font_catalog = FontCatalog(fonts)
+    return _bundled_font_catalog
+
+def get_font_catalog():
+    """Return a FontCatalog of all fonts in the font index."""
+    global _font_catalog
+    if _font_catalog is None:
+        _font_catalog = FontCatalog(get_indexed_fonts())
+    return _font_catalog
+
+def _search_catalog(catalog, name, *, weight=None, style=None, stretch=None, opticalsize=None, monospace=None, foundry=None, special=None):
+    # Find all fonts in the catalog which contain the specified name as a
+    # substring, and then narrow these down by each of the properties which
+    # was passed as an argument.
+    ids = catalog.match_name(name)
+    if len(ids) == 0:
+        raise NoFontFoundError("Invalid font name")
     if isinstance(weight, int):
-        fonts = filter_if_exists(fonts, "weight_number", weight)
+        ids = catalog.filter_if_exists(ids, "weight_number", weight)
     elif isinstance(weight, str):
-        fonts = filter_if_exists(fonts, "weight", weight)
-    fonts = filter_if_exists(fonts, "stretch", stretch)
-    fonts = filter_if_exists(fonts, "monospace", monospace)
-    fonts = filter_if_exists(fonts, "opticalsize", opticalsize)
-    fonts = filter_if_exists(fonts, "foundry", foundry)
-    fonts = filter_if_exists(fonts, "special", special)
+        ids = catalog.filter_if_exists(ids, "weight", weight)
+    ids = catalog.filter_if_exists(ids, "stretch", stretch)
+    ids = catalog.filter_if_exists(ids, "monospace", monospace)
+    ids = catalog.filter_if_exists(ids, "opticalsize", opticalsize)
+    ids = catalog.filter_if_exists(ids, "foundry", foundry)
+    ids = catalog.filter_if_exists(ids, "special", special)
     # We want "italic" to fall back to "oblique".  We don't need the reverse.
     try:
-        fonts = filter_if_exists(fonts, "style", style)
+        ids = catalog.filter_if_exists(ids, "style", style)
     except NoFontFoundError as e:
         if style == "italic":
             try:
-                fonts = filter_if_exists(fonts, "style", "oblique")
+                ids = catalog.filter_if_exists(ids, "style", "oblique")
             except NoFontFoundError as e2:
                 raise e
         else:
             raise e
+    return [catalog.fonts[i] for i in sorted(ids)]
+
+# Results of find_font and find_font_family.  These are bounded so that
+# long-running processes use a predictable amount of memory.  Use
+# font_cache_stats to check whether fonts are being served from the cache.
+_find_font_cache = LRUCache(maxsize=512)
+_find_font_family_cache = LRUCache(maxsize=512)
+
+def font_cache_stats():
+    """Return the hit, miss, and eviction counts of the font caches."""
+    return {"find_font": _find_font_cache.stats(),
+            "find_font_family": _find_font_family_cache.stats()}
+
+def clear_font_caches():
+    """Forget the results of all previous font searches."""
+    _find_font_cache.clear()
+    _find_font_family_cache.clear()
+
+def find_font(name, *, weight=None, style=None, stretch=None, opticalsize=None, monospace=None, foundry=None, special=None, multiple=False):
+    cachename = (name, weight, style, stretch, opticalsize, monospace, foundry, special, multiple)
+    cached = _find_font_cache.get(cachename)
+    if cached is not None:
+        return cached
+    # Check if they passed a filename for the name.  If so, return that.
+    if name is not None and os.path.isfile(name):
+        loadedttf = loadttf(name)
+        if loadedttf is None:
+            print(f"Warning: font path {name} could not be loaded, trying a more thorough search")
+        else:
+            _find_font_cache.set(cachename, loadedttf)
+            return loadedttf
+    # If not, search for fonts matching the name and properties.  Fonts which
+    # ship with matplotlib (e.g. the default, DejaVu Sans) are searched first,
+    # so that they can be found without scanning the system fonts.
+    fonts = None
+    bundled = get_bundled_font_catalog()
+    if bundled.has_family(name):
+        try:
+            fonts = _search_catalog(bundled, name, weight=weight, style=style, stretch=stretch,
+                                    opticalsize=opticalsize, monospace=monospace, foundry=foundry, special=special)
+        except NoFontFoundError:
+            pass
+    if fonts is None:
+        fonts = _search_catalog(get_font_catalog(), name, weight=weight, style=style, stretch=stretch,
+                                opticalsize=opticalsize, monospace=monospace, foundry=foundry, special=special)
     # If there is more than one option, give the user a chance to narrow it down.
     if len(fonts) > 1 and not multiple:
         differing_props = []
@@ -534,15 +889,14 @@ def find_font(name, *, weight=None, style=None, stretch=None, opticalsize=None,
         loadedttf = fonts
     else:
         loadedttf = fonts[0]
-    _find_font_cache[cachename] = loadedttf
+    _find_font_cache.set(cachename, loadedttf)
     return loadedttf
 
-_find_font_family_cache = {}
 def find_font_family(name, *, stretch=None, opticalsize=None, monospace=None, foundry=None, special=None):
-    global _find_font_family_cache
     cachename = (name, stretch, opticalsize, monospace, foundry, special)
-    if cachename in _find_font_family_cache.keys():
-        return _find_font_family_cache[cachename]
+    cached = _find_font_family_cache.get(cachename)
+    if cached is not None:
+        return cached
     # Get all the fonts which match the user's search criteria
     allfonts = find_font(name, stretch=stretch, opticalsize=opticalsize, monospace=monospace, foundry=foundry, special=special, multiple=True)
     # Check to make sure that only one family was returned.
@@ -642,7 +996,6 @@ def find_font_family(name, *, stretch=None, opticalsize=None, monospace=None, fo
             warningtext += "    " + matchingfonts[0]['fname'] + "\n"
             matchingfonts = matchingfonts[0:1]
             print(warningtext)
-        _find_font_family_cache[cachename] = matchingfonts[0]
         return matchingfonts[0]
     styles = {}
     try:
@@ -665,9 +1018,115 @@ def find_font_family(name, *, stretch=None, opticalsize=None, monospace=None, fo
         if styles[style]['num_faces'] > 1:
             print(f"Warning, font is a .ttc file with {styles[style]['num_faces']} embedded faces.  CanD can only use one.  If you have problems, try using a ttf or otf font instead.")
             break
-    _find_font_family_cache[cachename] = styles
+    _find_font_family_cache.set(cachename, styles)
     return styles
 
+# The font used by a Canvas unless another is chosen with set_font
+DEFAULT_FONT = dict(name="DejaVu Sans", stretch="normal")
+
+# Fonts which are used for characters missing from the requested font in
+# find_font_covering.  All of these are distributed with matplotlib.
+FALLBACK_FONTS = ["DejaVu Sans", "STIXGeneral", "DejaVu Serif", "STIXNonUnicode"]
+
+def missing_glyphs(font, text):
+    """Return the characters in `text` which have no glyph in `font`.
+
+    `font` should be a dict as returned by find_font.  The glyph
+    coverage stored in the font index is used, so the font file is not
+    opened.  Whitespace is ignored.
+    """
+    missing = set()
+    for char in set(text):
+        if char.isspace():
+            continue
+        c = ord(char)
+        i = bisect.bisect_right(font['coverage'], [c, float('inf')])
+        if i == 0 or font['coverage'][i-1][1] < c:
+            missing.add(char)
+    return missing
+
+def find_font_covering(text, name=None, *, fallbacks=None, **kwargs):
+    """Find a font with glyphs for all of the characters in `text`.
+
+    Fonts matching find_font(`name`, **kwargs) are checked first, and
+    then the fonts in each of the font families in `fallbacks`
+    (default: FALLBACK_FONTS), using the properties in `kwargs` where
+    possible.  Returns the first of these fonts which contains all of
+    the characters, or if none do, the font with the fewest missing
+    characters.
+    """
+    if fallbacks is None:
+        fallbacks = FALLBACK_FONTS
+    names = ([name] if name is not None else []) + list(fallbacks)
+    best = None
+    for n in names:
+        try:
+            fonts = find_font(n, multiple=True, **kwargs)
+        except NoFontFoundError:
+            try:
+                fonts = find_font(n, multiple=True)
+            except NoFontFoundError:
+                continue
+        # A single font is returned if `n` is the path of a font file
+        if isinstance(fonts, dict):
+            fonts = [fonts]
+        # Prefer the regular version of the font, if it has not been specified
+        for f in sorted(fonts, key=lambda f : f['base_style']):
+            nmissing = len(missing_glyphs(f, text))
+            if nmissing == 0:
+                return f
+            if best is None or nmissing < best[0]:
+                best = (nmissing, f)
+    if best is None:
+        raise NoFontFoundError("No fonts found")
+    print(f"Warning: no font has glyphs for all characters in {text!r}, using {best[1]['fname']}")
+    return best[1]
+
+def warm_up(families=None, rebuild=False, processes=None):
+    """Prepare the font index and caches, e.g. when a service starts.
+
+    This updates the on-disk font index (see build_font_index for
+    `rebuild` and `processes`) and then resolves each font family in
+    `families` with find_font_family, so that later searches for them
+    are served from the cache.  Each element of `families` may be
+    either the name of a font or a dict of keyword arguments to
+    find_font_family.  By default, these are the Canvas default font
+    plus any comma-separated font names in the CAND_WARM_FONTS
+    environment variable.  Returns a list of the resolved families.
+    """
+    if families is None:
+        families = [dict(DEFAULT_FONT)]
+        families += [f.strip() for f in os.environ.get("CAND_WARM_FONTS", "").split(",") if f.strip()]
+    build_font_index(rebuild=rebuild, processes=processes)
+    get_bundled_font_catalog()
+    return [find_font_family(**(f if isinstance(f, dict) else dict(name=f))) for f in families]
+
+def main(argv=None):
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(prog="python -m cand",
+                                     description="Manage the CanD font index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build-index", help="Build or update the font index, "
+                                  "and optionally check that font families can be found.")
+    build.add_argument("families", nargs="*", help="Font families to resolve after building the index")
+    build.add_argument("--rebuild", action="store_true", help="Reload all fonts, ignoring the existing index")
+    build.add_argument("--processes", type=int, default=None, help="Number of processes used to load fonts")
+    args = parser.parse_args(argv)
+    if args.command == "build-index":
+        start = time.time()
+        fonts = build_font_index(rebuild=args.rebuild, processes=args.processes)
+        print(f"Indexed {len(fonts)} fonts in {time.time()-start:.2f} s: {get_index_path()}")
+        for family in args.families:
+            try:
+                styles = find_font_family(family)
+            except (NoFontFoundError, MultipleFontsFoundError) as e:
+                print(f"Error finding font family \"{family}\": {e}")
+                return 1
+            for style,f in styles.items():
+                print(f"    {family} {style}: {f['fname']}")
+    return 0
+
 #TODO: Neutraface, EB Garamond, penumbra, gotham, fell, stone sans, univers arkandis (chooses condensed by default), Bell
 # Universalis is has the wrong value for typographic subfamily
 # Fell has crazy labeling
@@ -1,5 +1,7 @@
 import paranoid as pns
+import numpy as np
 import math
+import weakref
 
 class Metric(pns.Type):
     """A Paranoid Scientist Type for Points and Vectors."""
@@ -18,6 +20,15 @@ class Metric(pns.Type):
         yield Height(-1, "absolute")
         yield Height(2, "unique")
 
+class MetricArray(pns.Type):
+    """A Paranoid Scientist Type for PointArrays and VectorArrays."""
+    def test(self, v):
+        assert isinstance(v, PointArray) or isinstance(v, VectorArray)
+    def generate(self):
+        yield PointArray([0, .5], [0, .2])
+        yield PointArray([.3], [.1], "absolute")
+        yield VectorArray([.1, .2, .3], [0, 0, 0], "figure")
+
 @pns.paranoidclass
 class Point:
     """A point on the canvas in an arbitrary coordinate system.
@@ -34,19 +45,28 @@ class Point:
     produce the vector connecting the two points.
 
     """
+    __slots__ = ("x", "y", "coordinate")
     def __new__(cls, x, y, coordinate="default"):
         if isinstance(coordinate, tuple):
             return Point(x, 0, coordinate[0]) >> Point(0, y, coordinate[1])
         else:
             obj = object.__new__(cls)
-            obj.x = x
-            obj.y = y
-            obj.coordinate = coordinate
+            object.__setattr__(obj, "x", x)
+            object.__setattr__(obj, "y", y)
+            object.__setattr__(obj, "coordinate", coordinate)
             return obj
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self.__class__.__name__} objects are immutable")
+    def __delattr__(self, name):
+        raise AttributeError(f"{self.__class__.__name__} objects are immutable")
+    def __reduce__(self):
+        return (Point, (self.x, self.y, self.coordinate))
+    def __hash__(self):
+        return hash((self.x, self.y, self.coordinate))
     def __repr__(self):
         nondefault = f', "{self.coordinate}"' if self.coordinate != "default" else ""
         return f'{self.__class__.__name__}({self.x}, {self.y}{nondefault})'
-    @pns.accepts(pns.Self, Metric)
+    @pns.accepts(pns.Self, pns.Or(Metric, MetricArray))
     def __add__(self, other):
         """Add together a point and a vector.
 
@@ -54,13 +74,15 @@ class Point:
 
         Returns a Point
         """
+        if _is_array(other):
+            return NotImplemented
         if isinstance(other, Vector):
             if self.coordinate == other.coordinate and self.coordinate != "various":
                 return Point(self.x + other.x, self.y + other.y, self.coordinate)
             else:
                 return BinopPoint(self, '+', other)
         raise ValueError(f"Invalid addition between {self!r} and {other!r}.")
-    @pns.accepts(pns.Self, Metric)
+    @pns.accepts(pns.Self, pns.Or(Metric, MetricArray))
     def __sub__(self, other):
         """Find the vector which connects two points.
 
@@ -68,6 +90,8 @@ class Point:
 
         Returns a Vector.
         """
+        if _is_array(other):
+            return NotImplemented
         if isinstance(other, Vector):
             if self.coordinate == other.coordinate:
                 return Point(self.x - other.x, self.y - other.y, self.coordinate)
@@ -86,6 +110,8 @@ class Point:
 
         Returns True or False.
         """
+        if not isinstance(other, Point) or isinstance(other, MetaBinop):
+            return NotImplemented
         return (self.x == other.x) and (self.y == other.y) and (self.coordinate == other.coordinate)
     def __iter__(self):
         yield self.x
@@ -97,6 +123,8 @@ class Point:
 
         Returns a Point.
         """
+        if _is_array(other):
+            return NotImplemented
         if not isinstance(other, Point):
             raise ValueError(f"Invalid meet >> operation between {self!r} and {other!r}.")
         if self.coordinate == other.coordinate:
@@ -118,6 +146,8 @@ class Point:
 
         Returns a Point.
         """
+        if _is_array(other):
+            return NotImplemented
         if not isinstance(other, Point):
             raise ValueError(f"Invalid mean | operation between {self!r} and {other!r}.")
         if self.coordinate == other.coordinate:
@@ -148,24 +178,35 @@ class Vector:
     "Width" object, and with only a y component is a "Height" object.
 
     """
+    __slots__ = ("x", "y", "coordinate")
     def __new__(cls, x, y, coordinate="default"):
         if isinstance(coordinate, tuple):
             return Vector(x, 0, coordinate[0]) >> Vector(0, y, coordinate[1])
         else:
             obj = object.__new__(cls)
-            obj.x = x
-            obj.y = y
-            obj.coordinate = coordinate
+            object.__setattr__(obj, "x", x)
+            object.__setattr__(obj, "y", y)
+            object.__setattr__(obj, "coordinate", coordinate)
             return obj
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self.__class__.__name__} objects are immutable")
+    def __delattr__(self, name):
+        raise AttributeError(f"{self.__class__.__name__} objects are immutable")
+    def __reduce__(self):
+        return (Vector, (self.x, self.y, self.coordinate))
+    def __hash__(self):
+        return hash((self.x, self.y, self.coordinate))
     def __repr__(self):
         nondefault = f', "{self.coordinate}"' if self.coordinate != "default" else ""
         return f'{self.__class__.__name__}({self.x}, {self.y}{nondefault})'
-    @pns.accepts(pns.Self, Metric)
+    @pns.accepts(pns.Self, pns.Or(Metric, MetricArray))
     def __add__(self, other):
         """Add a vector to a Point or another Vector.
 
         If `other` is a Point, return a Point.  If `other` is a Vector, return a Vector.
         """
+        if _is_array(other):
+            return NotImplemented
         if isinstance(other, Point):
             return other + self
         elif isinstance(other, Vector):
@@ -174,7 +215,7 @@ class Vector:
             else:
                 return BinopVector(self, '+', other)
         raise ValueError(f"Invalid addition between {repr(self)} and {repr(other)}.")
-    @pns.accepts(pns.Self, pns.Self)
+    @pns.accepts(pns.Self, pns.Or(pns.Self, MetricArray))
     def __sub__(self, other):
         """Vector subtraction.
 
@@ -184,6 +225,8 @@ class Vector:
 
         Subtracting a vector is equivalent to adding the negative of the vector.
         """
+        if _is_array(other):
+            return NotImplemented
         if self.coordinate == other.coordinate:
             return Vector(self.x - other.x, self.y - other.y, self.coordinate)
         else:
@@ -221,7 +264,7 @@ class Vector:
         Return a Vector.
         """
         return Vector(self.x / other, self.y / other, self.coordinate)
-    @pns.accepts(pns.Self, pns.Self)
+    @pns.accepts(pns.Self, pns.Or(pns.Self, MetricArray))
     def __rshift__(self, other):
         """Take the x coordinate of this vector and the y coordinate of another vector.
 
@@ -229,13 +272,15 @@ class Vector:
 
         Returns a Vector.
         """
+        if _is_array(other):
+            return NotImplemented
         if not isinstance(other, Vector):
             raise ValueError(f"Invalid meet >> operation between {repr(self)} and {repr(other)}.")
         if self.coordinate == other.coordinate:
             return Vector(self.x, other.y, self.coordinate)
         else:
             return BinopVector(self, '>>', other)
-    @pns.accepts(pns.Self, pns.Self)
+    @pns.accepts(pns.Self, pns.Or(pns.Self, MetricArray))
     def __lshift__(self, other):
         """Take the y coordinate of this vector and the x coordinate of another vector.
 
@@ -280,7 +325,6 @@ class Vector:
     def flipy(self):
         """Returns a Vector reflected across the x-axis."""
         return Vector(self.x, -self.y, self.coordinate)
-    @pns.accepts(pns.Self, pns.Self)
     def __eq__(self, other):
         """Determine if two Vector objects are equal.  
 
@@ -288,6 +332,8 @@ class Vector:
 
         Returns True or False.
         """
+        if not isinstance(other, Vector) or isinstance(other, MetaBinop):
+            return NotImplemented
         return (self.x == other.x) and (self.y == other.y) and (self.coordinate == other.coordinate)
     def __iter__(self):
         yield self.x
@@ -317,9 +363,101 @@ def Height(y, coordinate="default"):
     """
     return Vector(0, y, coordinate)
 
+# Every operation on Points and Vectors is linear in their coordinates,
+# and most coordinate systems are affine maps to absolute coordinates,
+# "absolute = scale*coordinate + origin" with a diagonal scale.  So, a
+# Binop can be summarized by an "affine form" (const, terms), where
+# const is an (x,y) tuple in absolute coordinates and terms is a dict
+# indexed by coordinate system.  Each term is a pair of 2x2 matrices
+# (K, L), stored as tuples (m00, m01, m10, m11), such that
+#
+#     absolute = const + sum(K @ scale + L @ origin for each term)
+#
+# where scale and origin are those of the term's coordinate system.
+# Forms are computed when each Binop is created, from the forms of its
+# operands, so nested expressions collapse into a few terms.  Whether a
+# coordinate system is affine (and its scale and origin) is determined
+# by the Canvas.  Axis data coordinates usually aren't, so these
+# expressions are converted by evaluating the tree instead.
+
+_IDENTITY = (1, 0, 0, 1)
+_ZERO = (0, 0, 0, 0)
+
+def _matmul(m, n):
+    return (m[0]*n[0] + m[1]*n[2], m[0]*n[1] + m[1]*n[3],
+            m[2]*n[0] + m[3]*n[2], m[2]*n[1] + m[3]*n[3])
+
+def _affine_form(v):
+    # The affine form of a Point or Vector
+    if isinstance(v, MetaBinop):
+        return v._affine
+    if v.coordinate == "absolute":
+        return ((v.x, v.y), {})
+    origin = _IDENTITY if isinstance(v, Point) else _ZERO
+    return ((0, 0), {v.coordinate: ((v.x, 0, 0, v.y), origin)})
+
+def _affine_combine(ma, a, mb=None, b=None):
+    # The affine form of ma @ a + mb @ b, for 2x2 matrices ma and mb and
+    # affine forms a and b
+    (cx,cy),terms = a
+    if ma is _IDENTITY:
+        const = (cx, cy)
+        newterms = dict(terms)
+    else:
+        const = (ma[0]*cx + ma[1]*cy, ma[2]*cx + ma[3]*cy)
+        newterms = {c : (_matmul(ma, k), _matmul(ma, l)) for c,(k,l) in terms.items()}
+    if b is not None:
+        (cx,cy),terms = b
+        const = (const[0] + mb[0]*cx + mb[1]*cy, const[1] + mb[2]*cx + mb[3]*cy)
+        for c,(k,l) in terms.items():
+            if mb is not _IDENTITY:
+                k,l = _matmul(mb, k), _matmul(mb, l)
+            if c in newterms:
+                k0,l0 = newterms[c]
+                k = (k0[0]+k[0], k0[1]+k[1], k0[2]+k[2], k0[3]+k[3])
+                l = (l0[0]+l[0], l0[1]+l[1], l0[2]+l[2], l0[3]+l[3])
+            newterms[c] = (k,l)
+    return (const, newterms)
+
+def _affine_op(lhs, op, rhs):
+    # The affine form of the Binop "lhs op rhs", or None if it doesn't have
+    # one (e.g. division by zero, which is reported during conversion).
+    if not isinstance(lhs, (Point, Vector)):
+        return None
+    a = _affine_form(lhs)
+    if a is None:
+        return None
+    if op in ['*', '/', '@']:
+        if op == '*':
+            return _affine_combine((rhs, 0, 0, rhs), a)
+        if op == '/':
+            return _affine_combine((1/rhs, 0, 0, 1/rhs), a) if rhs != 0 else None
+        c = math.cos(math.radians(rhs))
+        s = math.sin(math.radians(rhs))
+        return _affine_combine((c, -s, s, c), a)
+    b = _affine_form(rhs)
+    if b is None:
+        return None
+    if op == '+':
+        return _affine_combine(_IDENTITY, a, _IDENTITY, b)
+    if op == '-':
+        return _affine_combine(_IDENTITY, a, (-1, 0, 0, -1), b)
+    if op == '>>':
+        return _affine_combine((1, 0, 0, 0), a, (0, 0, 0, 1), b)
+    if op == '|':
+        return _affine_combine((.5, 0, 0, .5), a, (.5, 0, 0, .5), b)
+    return None
+
 @pns.paranoidclass
 class MetaBinop:
+    # The slots are defined in the subclasses, since BinopPoint and
+    # BinopVector also inherit the slots of Point and Vector.
+    __slots__ = ()
     coordinate = "various"
+    # Binops are hash-consed: creating a Binop which is equal to an existing
+    # one returns the existing object.  So, repeated subexpressions are a
+    # single shared object, which only needs to be converted once.
+    _instances = weakref.WeakValueDictionary()
     op_table = {'+': lambda lhs,rhs : lhs + rhs,
                 '-': lambda lhs,rhs : lhs - rhs,
                 '*': lambda lhs,rhs : lhs * rhs,
@@ -329,11 +467,26 @@ class MetaBinop:
                 '@': lambda lhs,rhs : lhs @ rhs}
     @pns.accepts(pns.Unchecked, pns.Or(Metric, pns.Number), pns.Set(['+', '-', '*', '/', '>>', '|', '@']), pns.Or(Metric, pns.Number))
     def __new__(cls, lhs, op, rhs):
+        key = (cls, lhs, op, rhs)
+        try:
+            obj = MetaBinop._instances.get(key)
+        except TypeError: # Unhashable operand
+            key = None
+            obj = None
+        if obj is not None:
+            return obj
         obj = object.__new__(cls)
-        obj.lhs = lhs
-        obj.op = op
-        obj.rhs = rhs
+        object.__setattr__(obj, "lhs", lhs)
+        object.__setattr__(obj, "op", op)
+        object.__setattr__(obj, "rhs", rhs)
+        object.__setattr__(obj, "_hash", None)
+        object.__setattr__(obj, "_program", None)
+        object.__setattr__(obj, "_affine", _affine_op(lhs, op, rhs))
+        if key is not None:
+            MetaBinop._instances[key] = obj
         return obj
+    def __reduce__(self):
+        return (self.__class__, (self.lhs, self.op, self.rhs))
     def __repr__(self):
         # Make it look like a MetaBinop with two Points or two Vectors
         # is a point with the tuple-based naming scheme
@@ -348,7 +501,53 @@ class MetaBinop:
         rhstext = f'({repr(self.rhs)})' if isinstance(self.rhs, MetaBinop) and self.rhs.op != '>>' else repr(self.rhs)
         return f'{lhstext} {self.op} {rhstext}'
     def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, MetaBinop) or isinstance(self, Point) != isinstance(other, Point):
+            return NotImplemented
         return (self.lhs == other.lhs) and (self.op == other.op) and (self.rhs == other.rhs)
+    def __hash__(self):
+        # Cache the hash, since computing it requires walking the whole tree.
+        if self._hash is None:
+            object.__setattr__(self, "_hash", hash((self.op, self.lhs, self.rhs)))
+        return self._hash
+    def _compile(self):
+        """Flatten the tree into a list of instructions.
+
+        Each instruction is a tuple (op, lhs, rhs) whose result is
+        stored in the register with the same index as the instruction.
+        Leaves (Points and Vectors which are not Binops) have op None
+        and the leaf as lhs.  Otherwise, lhs is the register of the left
+        operand, and rhs is the register of the right operand, or a
+        number for the scalar operations "*", "/", and "@".  The result
+        is in the last register.  Shared subexpressions are only
+        included once.  The instructions are cached, so this only walks
+        the tree the first time it is called.
+        """
+        if self._program is not None:
+            return self._program
+        program = []
+        registers = {} # Indexed by id, since Points may be equal but in different places
+        stack = [(self, False)]
+        # Walk the tree without recursion, so that deep trees don't hit the
+        # recursion limit
+        while stack:
+            node,expanded = stack.pop()
+            if id(node) in registers:
+                continue
+            if not isinstance(node, MetaBinop):
+                registers[id(node)] = len(program)
+                program.append((None, node, None))
+            elif not expanded:
+                stack.append((node, True))
+                stack.extend((side, False) for side in [node.rhs, node.lhs]
+                             if isinstance(side, Point) or isinstance(side, Vector))
+            else:
+                rhs = registers[id(node.rhs)] if isinstance(node.rhs, Point) or isinstance(node.rhs, Vector) else node.rhs
+                registers[id(node)] = len(program)
+                program.append((node.op, registers[id(node.lhs)], rhs))
+        object.__setattr__(self, "_program", tuple(program))
+        return self._program
 
 @pns.paranoidclass
 class BinopPoint(MetaBinop,Point):
@@ -361,12 +560,17 @@ class BinopPoint(MetaBinop,Point):
     objects which results in a Point object.
 
     """
-    @pns.accepts(pns.Self, Vector)
+    __slots__ = ("lhs", "op", "rhs", "_hash", "_program", "_affine", "__weakref__")
+    @pns.accepts(pns.Self, pns.Or(Vector, MetricArray))
     def __add__(self, rhs):
+        if _is_array(rhs):
+            return NotImplemented
         if isinstance(rhs, Vector):
             return BinopPoint(self, '+', rhs)
-    @pns.accepts(pns.Self, Metric)
+    @pns.accepts(pns.Self, pns.Or(Metric, MetricArray))
     def __sub__(self, rhs):
+        if _is_array(rhs):
+            return NotImplemented
         if isinstance(rhs, Vector):
             return BinopPoint(self, '-', rhs)
         elif isinstance(rhs, Point):
@@ -374,11 +578,15 @@ class BinopPoint(MetaBinop,Point):
     def __lshift__(self, rhs):
         return rhs >> self
     def __rshift__(self, rhs):
+        if _is_array(rhs):
+            return NotImplemented
         if isinstance(rhs, Point):
             return BinopPoint(self, '>>', rhs)
         else:
             raise ValueError(f"Invalid meet >> between {repr(self)} and {repr(other)}.")
     def __or__(self, rhs):
+        if _is_array(rhs):
+            return NotImplemented
         if isinstance(rhs, Point):
             return BinopPoint(self, '|', rhs)
         else:
@@ -395,14 +603,19 @@ class BinopVector(MetaBinop,Vector):
     objects which results in a Vector object.
 
     """
-    @pns.accepts(pns.Self, Metric)
+    __slots__ = ("lhs", "op", "rhs", "_hash", "_program", "_affine", "__weakref__")
+    @pns.accepts(pns.Self, pns.Or(Metric, MetricArray))
     def __add__(self, rhs):
+        if _is_array(rhs):
+            return NotImplemented
         if isinstance(rhs, Vector):
             return BinopVector(self, '+', rhs)
         elif isinstance(rhs, Point):
             return rhs + self
-    @pns.accepts(pns.Self, Vector)
+    @pns.accepts(pns.Self, pns.Or(Vector, MetricArray))
     def __sub__(self, rhs):
+        if _is_array(rhs):
+            return NotImplemented
         return BinopVector(self, '-', rhs)
     @pns.accepts(pns.Self, pns.Number)
     def __mul__(self, rhs):
@@ -411,6 +624,8 @@ class BinopVector(MetaBinop,Vector):
     def __truediv__(self, rhs):
         return BinopVector(self, '/', rhs)
     def __rshift__(self, rhs):
+        if _is_array(rhs):
+            return NotImplemented
         if isinstance(rhs, Vector):
             return BinopVector(self, '>>', rhs)
         else:
@@ -437,3 +652,317 @@ class BinopVector(MetaBinop,Vector):
     def _generate(cls):
         yield cls(Point(0, 1), '+', Point(3, 2, "absolute"))
         yield cls(Point(-.2, .2), '-', cls(Point(0, -1, "absolute"), '+', Width(2, "otherunit")))
+
+def _is_array(v):
+    return isinstance(v, PointArray) or isinstance(v, VectorArray)
+
+def _array_op(lhs, op, rhs, cls):
+    # Apply `op` to `lhs` and `rhs`, at least one of which is a PointArray or
+    # VectorArray, giving an object of type `cls` (PointArray or VectorArray).
+    # Like for Points and Vectors, this is only computed immediately if
+    # everything is in the same coordinate system.
+    binop = BinopPointArray if cls is PointArray else BinopVectorArray
+    if _is_array(lhs) and _is_array(rhs) and len(lhs) != len(rhs) and 1 not in [len(lhs), len(rhs)]:
+        raise ValueError(f"Cannot combine arrays of lengths {len(lhs)} and {len(rhs)}")
+    if op in ['*', '/', '@']: # rhs is a scalar
+        if lhs.coordinate == "various" or (op == '@' and lhs.coordinate != "absolute"):
+            return binop(lhs, op, rhs)
+        if op == '*':
+            return cls(lhs.x * rhs, lhs.y * rhs, lhs.coordinate)
+        if op == '/':
+            return cls(lhs.x / rhs, lhs.y / rhs, lhs.coordinate)
+        c = math.cos(math.radians(rhs))
+        s = math.sin(math.radians(rhs))
+        return cls(lhs.x * c - lhs.y * s, lhs.x * s + lhs.y * c, lhs.coordinate)
+    if lhs.coordinate != rhs.coordinate or lhs.coordinate == "various":
+        return binop(lhs, op, rhs)
+    if op == '+':
+        return cls(lhs.x + rhs.x, lhs.y + rhs.y, lhs.coordinate)
+    if op == '-':
+        return cls(lhs.x - rhs.x, lhs.y - rhs.y, lhs.coordinate)
+    if op == '>>':
+        return cls(lhs.x, rhs.y, lhs.coordinate)
+    if op == '|':
+        return cls((lhs.x + rhs.x)/2, (lhs.y + rhs.y)/2, lhs.coordinate)
+    raise ValueError(f"Invalid operation {op}")
+
+def _make_arrays(x, y):
+    # Convert x and y to read-only 1-dimensional arrays of the same length
+    x,y = np.broadcast_arrays(np.array(x, dtype=float, ndmin=1), np.array(y, dtype=float, ndmin=1))
+    if x.ndim != 1:
+        raise ValueError("Coordinates must be 1-dimensional")
+    x = x.copy()
+    y = y.copy()
+    x.setflags(write=False)
+    y.setflags(write=False)
+    return x,y
+
+@pns.paranoidclass
+class PointArray:
+    """Many points on the canvas in the same coordinate system.
+
+    A PointArray is the equivalent of a list of Points which all have
+    the same coordinate system.  The x and y coordinates are given as
+    arrays `x` and `y` (or scalars, which are broadcast), in the
+    coordinate system `coordinate`.
+
+    PointArrays support the same operations as Points, and operations
+    may be applied between a PointArray and a single Point or Vector.
+    For example, adding a Vector to a PointArray shifts every point.
+    Canvas methods convert all of the points at once, which is much
+    faster than converting them one at a time.  Indexing a PointArray
+    gives a Point.
+
+    """
+    __slots__ = ("x", "y", "coordinate")
+    def __new__(cls, x, y, coordinate="default"):
+        x,y = _make_arrays(x, y)
+        if isinstance(coordinate, tuple):
+            return PointArray(x, 0, coordinate[0]) >> PointArray(0, y, coordinate[1])
+        obj = object.__new__(cls)
+        object.__setattr__(obj, "x", x)
+        object.__setattr__(obj, "y", y)
+        object.__setattr__(obj, "coordinate", coordinate)
+        return obj
+    @classmethod
+    def from_points(cls, points):
+        """Create a PointArray from a list of Points in the same coordinate system."""
+        coordinates = set(p.coordinate for p in points)
+        if len(coordinates) != 1 or "various" in coordinates:
+            raise ValueError("All Points must have the same coordinate system")
+        return cls([p.x for p in points], [p.y for p in points], coordinates.pop())
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self.__class__.__name__} objects are immutable")
+    def __delattr__(self, name):
+        raise AttributeError(f"{self.__class__.__name__} objects are immutable")
+    def __reduce__(self):
+        return (PointArray, (self.x, self.y, self.coordinate))
+    def __repr__(self):
+        nondefault = f', "{self.coordinate}"' if self.coordinate != "default" else ""
+        return f'{self.__class__.__name__}({self.x.tolist()}, {self.y.tolist()}{nondefault})'
+    def __len__(self):
+        return len(self.x)
+    def __getitem__(self, i):
+        if isinstance(i, slice) or np.ndim(i) > 0:
+            return PointArray(self.x[i], self.y[i], self.coordinate)
+        return Point(float(self.x[i]), float(self.y[i]), self.coordinate)
+    def __iter__(self):
+        for i in range(0, len(self)):
+            yield self[i]
+    def __eq__(self, other):
+        if not isinstance(other, PointArray) or isinstance(other, MetaBinopArray):
+            return NotImplemented
+        return self.coordinate == other.coordinate and np.array_equal(self.x, other.x) and np.array_equal(self.y, other.y)
+    def __hash__(self):
+        # Adding 0 turns -0.0 into 0.0, which are equal but have different bytes
+        return hash(((self.x + 0.0).tobytes(), (self.y + 0.0).tobytes(), self.coordinate))
+    @pns.accepts(pns.Self, pns.Or(Vector, MetricArray))
+    def __add__(self, other):
+        """Add a Vector or VectorArray to each point.  Returns a PointArray."""
+        if not (isinstance(other, Vector) or isinstance(other, VectorArray)):
+            raise ValueError(f"Invalid addition between {self!r} and {other!r}.")
+        return _array_op(self, '+', other, PointArray)
+    def __radd__(self, other):
+        if not (isinstance(other, Vector) or isinstance(other, VectorArray)):
+            raise ValueError(f"Invalid addition between {other!r} and {self!r}.")
+        return _array_op(self, '+', other, PointArray)
+    @pns.accepts(pns.Self, pns.Or(Metric, MetricArray))
+    def __sub__(self, other):
+        """Subtract a Vector from each point, or find the Vectors to a Point.
+
+        If `other` is a Vector or VectorArray, return a PointArray.  If
+        it is a Point or PointArray, return a VectorArray.
+        """
+        if isinstance(other, Point) or isinstance(other, PointArray):
+            return _array_op(self, '-', other, VectorArray)
+        return _array_op(self, '-', other, PointArray)
+    def __rsub__(self, other):
+        if isinstance(other, Point):
+            return _array_op(other, '-', self, VectorArray)
+        return NotImplemented
+    @pns.accepts(pns.Self, pns.Or(Point, MetricArray))
+    def __rshift__(self, other):
+        """Take the x coordinates of these points and the y coordinates of `other`."""
+        return _array_op(self, '>>', other, PointArray)
+    def __rrshift__(self, other):
+        return _array_op(other, '>>', self, PointArray)
+    def __lshift__(self, other):
+        """Take the y coordinates of these points and the x coordinates of `other`."""
+        return other >> self
+    def __rlshift__(self, other):
+        return self >> other
+    @pns.accepts(pns.Self, pns.Or(Point, MetricArray))
+    def __or__(self, other):
+        """Return the points in the center of these points and `other`."""
+        return _array_op(self, '|', other, PointArray)
+    def __ror__(self, other):
+        return _array_op(other, '|', self, PointArray)
+
+@pns.paranoidclass
+class VectorArray:
+    """Many vectors in the same coordinate system.
+
+    A VectorArray is the equivalent of a list of Vectors which all have
+    the same coordinate system.  The x and y components are given as
+    arrays `x` and `y` (or scalars, which are broadcast), in the
+    coordinate system `coordinate`.
+
+    VectorArrays support the same operations as Vectors, and
+    operations may be applied between a VectorArray and a single Point
+    or Vector.  Indexing a VectorArray gives a Vector.
+
+    """
+    __slots__ = ("x", "y", "coordinate")
+    def __new__(cls, x, y, coordinate="default"):
+        x,y = _make_arrays(x, y)
+        if isinstance(coordinate, tuple):
+            return VectorArray(x, 0, coordinate[0]) >> VectorArray(0, y, coordinate[1])
+        obj = object.__new__(cls)
+        object.__setattr__(obj, "x", x)
+        object.__setattr__(obj, "y", y)
+        object.__setattr__(obj, "coordinate", coordinate)
+        return obj
+    @classmethod
+    def from_vectors(cls, vectors):
+        """Create a VectorArray from a list of Vectors in the same coordinate system."""
+        coordinates = set(v.coordinate for v in vectors)
+        if len(coordinates) != 1 or "various" in coordinates:
+            raise ValueError("All Vectors must have the same coordinate system")
+        return cls([v.x for v in vectors], [v.y for v in vectors], coordinates.pop())
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self.__class__.__name__} objects are immutable")
+    def __delattr__(self, name):
+        raise AttributeError(f"{self.__class__.__name__} objects are immutable")
+    def __reduce__(self):
+        return (VectorArray, (self.x, self.y, self.coordinate))
+    def __repr__(self):
+        nondefault = f', "{self.coordinate}"' if self.coordinate != "default" else ""
+        return f'{self.__class__.__name__}({self.x.tolist()}, {self.y.tolist()}{nondefault})'
+    def __len__(self):
+        return len(self.x)
+    def __getitem__(self, i):
+        if isinstance(i, slice) or np.ndim(i) > 0:
+            return VectorArray(self.x[i], self.y[i], self.coordinate)
+        return Vector(float(self.x[i]), float(self.y[i]), self.coordinate)
+    def __iter__(self):
+        for i in range(0, len(self)):
+            yield self[i]
+    def __eq__(self, other):
+        if not isinstance(other, VectorArray) or isinstance(other, MetaBinopArray):
+            return NotImplemented
+        return self.coordinate == other.coordinate and np.array_equal(self.x, other.x) and np.array_equal(self.y, other.y)
+    def __hash__(self):
+        # Adding 0 turns -0.0 into 0.0, which are equal but have different bytes
+        return hash(((self.x + 0.0).tobytes(), (self.y + 0.0).tobytes(), self.coordinate))
+    @pns.accepts(pns.Self, pns.Or(Metric, MetricArray))
+    def __add__(self, other):
+        """Add to a Point or Vector, or a PointArray or VectorArray.
+
+        Return a PointArray if `other` is a Point or PointArray, otherwise
+        a VectorArray.
+        """
+        if isinstance(other, Point) or isinstance(other, PointArray):
+            return _array_op(other, '+', self, PointArray)
+        return _array_op(self, '+', other, VectorArray)
+    def __radd__(self, other):
+        return self + other
+    @pns.accepts(pns.Self, pns.Or(Vector, MetricArray))
+    def __sub__(self, other):
+        """Vector subtraction.  Returns a VectorArray."""
+        return _array_op(self, '-', other, VectorArray)
+    def __rsub__(self, other):
+        if isinstance(other, Point):
+            return _array_op(other, '-', self, PointArray)
+        return _array_op(other, '-', self, VectorArray)
+    @pns.accepts(pns.Self, pns.Number)
+    def __mul__(self, other):
+        """Multiply each vector by a scalar.  Returns a VectorArray."""
+        return _array_op(self, '*', other, VectorArray)
+    @pns.accepts(pns.Self, pns.Number)
+    def __rmul__(self, other):
+        return self * other
+    @pns.accepts(pns.Self)
+    def __neg__(self):
+        return -1 * self
+    @pns.accepts(pns.Self, pns.Number)
+    @pns.requires("other != 0")
+    def __truediv__(self, other):
+        """Divide each vector by a scalar.  Returns a VectorArray."""
+        return _array_op(self, '/', other, VectorArray)
+    @pns.accepts(pns.Self, pns.Or(Vector, MetricArray))
+    def __rshift__(self, other):
+        """Take the x components of these vectors and the y components of `other`."""
+        return _array_op(self, '>>', other, VectorArray)
+    def __rrshift__(self, other):
+        return _array_op(other, '>>', self, VectorArray)
+    def __lshift__(self, other):
+        """Take the y components of these vectors and the x components of `other`."""
+        return other >> self
+    def __rlshift__(self, other):
+        return self >> other
+    @pns.accepts(pns.Self, pns.Number)
+    def __matmul__(self, other):
+        """Rotate each vector by `other` degrees.  Returns a VectorArray."""
+        return _array_op(self, '@', other, VectorArray)
+    def width(self):
+        """Returns a VectorArray of the x components of the vectors."""
+        return ((Point(0, 0, "absolute") + self) >> Point(0, 0, "absolute")) - Point(0, 0, "absolute")
+    def height(self):
+        """Returns a VectorArray of the y components of the vectors."""
+        return ((Point(0, 0, "absolute") + self) << Point(0, 0, "absolute")) - Point(0, 0, "absolute")
+    def flipx(self):
+        """Returns the VectorArray reflected across the y-axis."""
+        return (-self) >> self
+    def flipy(self):
+        """Returns the VectorArray reflected across the x-axis."""
+        return self >> (-self)
+
+@pns.paranoidclass
+class MetaBinopArray:
+    # Like MetaBinop, but for operations where at least one side is a
+    # PointArray or VectorArray.
+    __slots__ = ()
+    coordinate = "various"
+    op_table = MetaBinop.op_table
+    def __new__(cls, lhs, op, rhs):
+        obj = object.__new__(cls)
+        object.__setattr__(obj, "lhs", lhs)
+        object.__setattr__(obj, "op", op)
+        object.__setattr__(obj, "rhs", rhs)
+        return obj
+    def __reduce__(self):
+        return (self.__class__, (self.lhs, self.op, self.rhs))
+    def __repr__(self):
+        lhstext = f'({repr(self.lhs)})' if isinstance(self.lhs, (MetaBinop, MetaBinopArray)) else repr(self.lhs)
+        rhstext = f'({repr(self.rhs)})' if isinstance(self.rhs, (MetaBinop, MetaBinopArray)) else repr(self.rhs)
+        return f'{lhstext} {self.op} {rhstext}'
+    def __len__(self):
+        return max(len(side) for side in [self.lhs, self.rhs] if _is_array(side))
+    def __getitem__(self, i):
+        # Index each array operand, and apply the operation to the results.
+        # This gives a BinopPoint or BinopVector for an integer, or a Binop
+        # array for a slice.  Operands of length 1 are broadcast.
+        def index(side):
+            if not _is_array(side):
+                return side
+            if len(side) == 1 and len(self) != 1:
+                return side if isinstance(i, slice) or np.ndim(i) > 0 else side[0]
+            return side[i]
+        return self.op_table[self.op](index(self.lhs), index(self.rhs))
+    def __iter__(self):
+        for i in range(0, len(self)):
+            yield self[i]
+    def __eq__(self, other):
+        if not isinstance(other, MetaBinopArray) or isinstance(self, PointArray) != isinstance(other, PointArray):
+            return NotImplemented
+        return (self.lhs == other.lhs) and (self.op == other.op) and (self.rhs == other.rhs)
+    def __hash__(self):
+        return hash((self.op, self.lhs, self.rhs))
+
+class BinopPointArray(MetaBinopArray,PointArray):
+    """A PointArray which is a composite of points and vectors in different bases."""
+    __slots__ = ("lhs", "op", "rhs")
+
+class BinopVectorArray(MetaBinopArray,VectorArray):
+    """A VectorArray which is a composite of points and vectors in different bases."""
+    __slots__ = ("lhs", "op", "rhs")
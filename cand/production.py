@@ -0,0 +1,67 @@
+# Production mode, which removes Paranoid Scientist checks from hot paths
+import paranoid as pns
+from . import metrics, canvas
+
+# Classes whose methods are decorated with Paranoid Scientist decorators
+_CLASSES = [metrics.Point, metrics.Vector, metrics.MetaBinop, metrics.BinopPoint,
+            metrics.BinopVector, metrics.PointArray, metrics.VectorArray,
+            metrics.MetaBinopArray, metrics.BinopPointArray, metrics.BinopVectorArray,
+            canvas.Canvas]
+
+# The original (checked) methods, indexed by (class, name), while production
+# mode is enabled.  None if production mode is disabled.
+_checked_methods = None
+
+def _unwrap(func):
+    # Each Paranoid Scientist decorator shares a single wrapper, which keeps
+    # the original function in __wrapped__.
+    while hasattr(func, "__wrapped__") and pns.utils.has_fun_prop(func, "active"):
+        func = func.__wrapped__
+    return func
+
+def enable_production_mode():
+    """Remove the runtime checks on CanD's methods.
+
+    By default, the arguments and return values of most functions in
+    CanD are checked with Paranoid Scientist.  This makes errors
+    easier to find, but it has a large overhead on code which creates
+    and converts many Points and Vectors.  Production mode replaces
+    CanD's methods with the unchecked versions.  Paranoid Scientist
+    checks in other code, including your own, are not affected.
+    Invalid arguments to CanD may then give confusing errors, or none
+    at all, so it is best to develop in checked mode.
+
+    Production mode can also be enabled by setting the environment
+    variable CAND_PRODUCTION=1 before importing cand.
+    """
+    global _checked_methods
+    if _checked_methods is not None:
+        return
+    _checked_methods = {}
+    for cls in _CLASSES:
+        for name,meth in list(vars(cls).items()):
+            if isinstance(meth, (staticmethod, classmethod)):
+                unwrapped = type(meth)(_unwrap(meth.__func__))
+                if unwrapped.__func__ is meth.__func__:
+                    continue
+            elif callable(meth):
+                unwrapped = _unwrap(meth)
+                if unwrapped is meth:
+                    continue
+            else:
+                continue
+            _checked_methods[(cls, name)] = meth
+            setattr(cls, name, unwrapped)
+
+def disable_production_mode():
+    """Restore the runtime checks removed by enable_production_mode."""
+    global _checked_methods
+    if _checked_methods is None:
+        return
+    for (cls, name),meth in _checked_methods.items():
+        setattr(cls, name, meth)
+    _checked_methods = None
+
+def is_production_mode():
+    """Return True if production mode is enabled."""
+    return _checked_methods is not None
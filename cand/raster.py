@@ -0,0 +1,144 @@
+# Decoding, resampling, and rasterizing images for png output
+import os
+import fitz as mupdf # PyMuPDF
+from PIL import Image
+from .cache import LRUCache, MemoryLRUCache
+
+def _image_bytes(img):
+    return img.size[0] * img.size[1] * len(img.getbands())
+
+_DEFAULT_CACHE_MB = 256
+
+def _raster_cache_budget():
+    # The memory budget of the image cache in bytes, from the
+    # CAND_RASTER_CACHE_MB environment variable if it is valid.
+    value = os.environ.get("CAND_RASTER_CACHE_MB")
+    if value is not None:
+        try:
+            maxbytes = int(float(value)*2**20)
+            if maxbytes >= 0:
+                return maxbytes
+        except (ValueError, OverflowError):
+            pass
+        print(f"Warning: Invalid CAND_RASTER_CACHE_MB {value!r}, using the default of {_DEFAULT_CACHE_MB} MB")
+    return _DEFAULT_CACHE_MB*2**20
+
+# Resampled images and rendered pdf pages.  These are keyed by the kind of
+# data, the file, its modification time, and the size of the output, and are
+# shared between Canvases, since the same logos and schematics are often
+# placed on many figures.  The memory budget (in MB) can be set with the
+# CAND_RASTER_CACHE_MB environment variable or set_raster_cache_size.
+_raster_cache = MemoryLRUCache(maxbytes=_raster_cache_budget(), sizeof=_image_bytes)
+# The sizes of images, used for positioning them
+_size_cache = LRUCache(maxsize=1024)
+
+def _file_key(path):
+    # Identify a file by its absolute path and modification time, so that
+    # cached data is not reused after the file changes.
+    path = os.path.abspath(path)
+    return (path, os.stat(path).st_mtime_ns)
+
+def rasterize_pdf(path, size, clip=None):
+    """Render the first page of the pdf file `path` as an RGBA PIL Image.
+
+    The page is rendered directly at `size`, a (width, height) tuple in
+    pixels, so it does not need to be resampled afterwards.
+    Optionally, `clip` is a (left, upper, right, lower) box in pixels
+    within `size`, and only this part of the page is rendered.
+    Rendered pages are cached until the file changes.  The returned
+    image is shared with the cache, so it must not be modified.
+    """
+    size = tuple(size)
+    clip = (0, 0) + size if clip is None else tuple(clip)
+    key = ("pdf",) + _file_key(path) + (size, clip)
+    img = _raster_cache.get(key)
+    if img is None:
+        pdf = mupdf.open(path)
+        try:
+            page = pdf[0]
+            rect = page.rect
+            scale_x = size[0]/rect.width
+            scale_y = size[1]/rect.height
+            cliprect = mupdf.Rect(rect.x0 + clip[0]/scale_x, rect.y0 + clip[1]/scale_y,
+                                  rect.x0 + clip[2]/scale_x, rect.y0 + clip[3]/scale_y)
+            matrix = mupdf.Matrix(scale_x, scale_y)
+            try:
+                pixmap = page.getPixmap(alpha=True, matrix=matrix, clip=cliprect)
+            except AttributeError:
+                pixmap = page.get_pixmap(alpha=True, matrix=matrix, clip=cliprect)
+            # Wrap the pixmap's samples without copying them.  MuPDF
+            # premultiplies the alpha channel, so convert to straight alpha.
+            try:
+                samples = pixmap.samples_mv
+            except AttributeError:
+                samples = pixmap.samples
+            img = Image.frombuffer("RGBa", (pixmap.width, pixmap.height), samples, "raw", "RGBa", pixmap.stride, 1)
+            img = img.convert("RGBA")
+        finally:
+            pdf.close()
+        # MuPDF rounds the pixmap to whole pixels, which could in principle
+        # be off by one.
+        clip_size = (clip[2]-clip[0], clip[3]-clip[1])
+        if img.size != clip_size:
+            img = img.resize(clip_size, Image.LANCZOS)
+        _raster_cache.set(key, img)
+    return img
+
+def load_image(path):
+    """Load the image file `path` (e.g. png or jpeg) as an RGBA PIL Image.
+
+    This is the same as resampling the image to its own size, so it is
+    cached like resample_image.
+    """
+    return resample_image(path, image_size(path))
+
+def resample_image(path, size):
+    """Load the image file `path`, resampled to `size`, as an RGBA PIL Image.
+
+    `size` is a (width, height) tuple in pixels.  Resampled images are
+    cached until the file changes.  The returned image is shared with
+    the cache, so it must not be modified.
+    """
+    size = tuple(size)
+    key = ("resampled",) + _file_key(path) + (size,)
+    img = _raster_cache.get(key)
+    if img is None:
+        # Only the resampled image is cached, since the full decoded image
+        # may be much larger, and is only needed to resample it.
+        with Image.open(path) as f:
+            img = f.convert("RGBA")
+        if img.size != size:
+            img = img.resize(size, Image.LANCZOS)
+        _raster_cache.set(key, img)
+    return img
+
+def image_size(path):
+    """The (width, height) of an image file in pixels, or of a pdf in points."""
+    key = _file_key(path)
+    size = _size_cache.get(key)
+    if size is None:
+        if path.endswith(".pdf"):
+            pdf = mupdf.open(path)
+            try:
+                bound = pdf[0].bound()
+                size = (bound.width, bound.height)
+            finally:
+                pdf.close()
+        else:
+            with Image.open(path) as img:
+                size = img.size
+        _size_cache.set(key, size)
+    return size
+
+def set_raster_cache_size(maxbytes):
+    """Limit the memory used by cached images to `maxbytes` bytes."""
+    _raster_cache.resize(maxbytes)
+
+def raster_cache_stats():
+    """Return the hit/miss statistics and memory use of the image cache."""
+    return _raster_cache.stats()
+
+def clear_raster_cache():
+    """Remove all images from the cache."""
+    _raster_cache.clear()
+    _size_cache.clear()
@@ -0,0 +1,238 @@
+# A minimal reader for sfnt (TrueType/OpenType) font files
+import mmap
+import struct
+import numpy as np
+
+class SfntError(ValueError):
+    pass
+
+TTC_TAG = b"ttcf"
+SFNT_VERSIONS = [b"\x00\x01\x00\x00", b"OTTO", b"true"]
+
+class SfntFont:
+    """The metadata tables of a ttf, otf, or ttc font file.
+
+    Reading a font this way is much faster than loading it with
+    FreeType, since we only need to read the table directory and the
+    few small tables which describe the font: "name", "OS/2", "post",
+    and "head".  Each of these is decoded once, when the object is
+    created.  For .ttc files, `index` gives the face to read.  The
+    character map is also read from the "cmap" table.
+
+    This implements the subset of the interface of
+    matplotlib.ft2font.FT2Font used by fontant.  Style and face flags
+    are computed from the tables the same way FreeType computes them.
+    Raises SfntError if the file cannot be read or has features this
+    reader doesn't understand (e.g. variable fonts), in which case the
+    font should be loaded with FreeType instead.
+    """
+    def __init__(self, path, index=0):
+        self.fname = path
+        self._index = index
+        self._cff = False
+        self._ps_font_info = None
+        try:
+            with open(path, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    self._read(data, index)
+        except (OSError, ValueError, struct.error, IndexError, KeyError) as e:
+            if isinstance(e, SfntError):
+                raise
+            raise SfntError(f"Could not read {path}: {e}") from e
+    def _read(self, data, index):
+        offset = 0
+        self.num_faces = 1
+        if data[0:4] == TTC_TAG:
+            self.num_faces, = struct.unpack_from(">L", data, 8)
+            if not 0 <= index < self.num_faces:
+                raise SfntError("Invalid face index")
+            offset, = struct.unpack_from(">L", data, 12+4*index)
+        elif index != 0:
+            raise SfntError("Invalid face index")
+        version = data[offset:offset+4]
+        if version not in SFNT_VERSIONS:
+            raise SfntError("Not an sfnt font")
+        self._cff = (version == b"OTTO")
+        numtables, = struct.unpack_from(">H", data, offset+4)
+        tables = {}
+        for i in range(0, numtables):
+            tag, _, toffset, tlength = struct.unpack_from(">4sLLL", data, offset+12+16*i)
+            if tag in [b"name", b"OS/2", b"post", b"head", b"cmap", b"maxp"]:
+                tables[tag] = data[toffset:toffset+tlength]
+            else:
+                tables[tag] = None
+        # FreeType synthesizes names for the instances of variable fonts,
+        # which we don't try to reproduce.
+        if b"fvar" in tables:
+            raise SfntError("Variable fonts are not supported")
+        if b"name" not in tables or b"head" not in tables:
+            raise SfntError("Missing required tables")
+        self._sfnt = self._read_name(tables[b"name"])
+        self._os2 = self._read_os2(tables[b"OS/2"]) if b"OS/2" in tables else None
+        self._post = self._read_post(tables[b"post"]) if b"post" in tables else None
+        self._head = self._read_head(tables[b"head"])
+        numglyphs = struct.unpack_from(">H", tables[b"maxp"], 4)[0] if b"maxp" in tables else None
+        self._cmap = self._read_cmap(tables[b"cmap"], numglyphs) if b"cmap" in tables else None
+        self._charmap = None
+        self.postscript_name = self._read_postscript_name()
+        self.style_flags = self._read_style_flags()
+        self.face_flags = self._read_face_flags()
+    @staticmethod
+    def _read_name(table):
+        _, count, storage = struct.unpack_from(">HHH", table, 0)
+        names = {}
+        for i in range(0, count):
+            pid, eid, lid, nid, length, offset = struct.unpack_from(">HHHHHH", table, 6+12*i)
+            # Like FreeType, skip empty or invalid records
+            if length == 0 or storage+offset+length > len(table):
+                continue
+            names[(pid, eid, lid, nid)] = bytes(table[storage+offset:storage+offset+length])
+        return names
+    @staticmethod
+    def _read_os2(table):
+        version, = struct.unpack_from(">H", table, 0)
+        weight, width = struct.unpack_from(">HH", table, 4)
+        vendor = bytes(table[58:62])
+        selection, = struct.unpack_from(">H", table, 62)
+        return {"version": version, "usWeightClass": weight, "usWidthClass": width,
+                "achVendID": vendor, "fsSelection": selection}
+    @staticmethod
+    def _read_post(table):
+        angle_int, angle_frac = struct.unpack_from(">hH", table, 4)
+        fixed_pitch, = struct.unpack_from(">L", table, 12)
+        return {"italicAngle": (angle_int, angle_frac), "isFixedPitch": fixed_pitch}
+    @staticmethod
+    def _read_head(table):
+        mac_style, = struct.unpack_from(">H", table, 44)
+        return {"macStyle": mac_style}
+    @staticmethod
+    def _read_cmap(table, numglyphs):
+        # Like FreeType, prefer a unicode subtable which can represent all
+        # unicode characters.  Only formats 4, 12, and 13 are supported, which
+        # are used by nearly all modern fonts.  Returns sorted arrays of
+        # character codes and their glyph indices, or None if there is no
+        # supported unicode subtable.
+        _, numsubtables = struct.unpack_from(">HH", table, 0)
+        subtables = {}
+        for i in range(0, numsubtables):
+            pid, eid, offset = struct.unpack_from(">HHL", table, 4+8*i)
+            subtables.setdefault((pid, eid), offset)
+        for key in [(3, 10), (0, 6), (0, 4), (3, 1), (0, 3), (0, 2), (0, 1), (0, 0)]:
+            if key in subtables:
+                offset = subtables[key]
+                break
+        else:
+            return None
+        fmt, = struct.unpack_from(">H", table, offset)
+        # Compute the glyph index for each character with numpy, since fonts
+        # may contain tens of thousands of characters.
+        codes = []
+        glyphs = []
+        if fmt == 4:
+            segx2, = struct.unpack_from(">H", table, offset+6)
+            nseg = segx2//2
+            ends = struct.unpack_from(f">{nseg}H", table, offset+14)
+            starts = struct.unpack_from(f">{nseg}H", table, offset+16+segx2)
+            deltas = struct.unpack_from(f">{nseg}h", table, offset+16+2*segx2)
+            rangeoffsets_pos = offset+16+3*segx2
+            rangeoffsets = struct.unpack_from(f">{nseg}H", table, rangeoffsets_pos)
+            glyphids = np.frombuffer(table, dtype=">u2", offset=rangeoffsets_pos,
+                                     count=(len(table)-rangeoffsets_pos)//2)
+            for i in range(0, nseg):
+                c = np.arange(starts[i], min(ends[i], 0xfffe)+1)
+                if rangeoffsets[i] == 0:
+                    g = (c + deltas[i]) & 0xffff
+                else:
+                    g = glyphids[i + rangeoffsets[i]//2 + (c-starts[i])].astype(int)
+                    g = np.where(g != 0, (g + deltas[i]) & 0xffff, 0)
+                codes.append(c)
+                glyphs.append(g)
+        elif fmt in [12, 13]:
+            ngroups, = struct.unpack_from(">L", table, offset+12)
+            groups = np.frombuffer(table, dtype=">u4", offset=offset+16, count=3*ngroups).reshape(-1, 3).astype(np.int64)
+            for start,end,glyph in groups:
+                c = np.arange(start, min(end, 0x10ffff)+1)
+                codes.append(c)
+                glyphs.append(glyph + (c - start) if fmt == 12 else np.full(len(c), glyph))
+        else:
+            return None
+        codes = np.concatenate(codes) if codes else np.zeros(0, dtype=int)
+        glyphs = np.concatenate(glyphs) if glyphs else np.zeros(0, dtype=int)
+        # FreeType ignores characters mapped to glyphs which don't exist.
+        valid = (glyphs != 0)
+        if numglyphs is not None:
+            valid &= (glyphs < numglyphs)
+        order = np.argsort(codes[valid], kind="stable")
+        return codes[valid][order], glyphs[valid][order]
+    def _read_postscript_name(self):
+        # Like FreeType, prefer the Windows name over the Macintosh name.
+        for key,encoding in [((3, 1, 0x409, 6), "utf_16_be"), ((1, 0, 0, 6), "latin-1")]:
+            if key in self._sfnt:
+                name = self._sfnt[key].decode(encoding, errors="replace")
+                # FreeType drops characters which are not printable ascii.
+                if not all(32 < ord(c) < 127 for c in name):
+                    raise SfntError("Postscript name is not printable ascii")
+                return name
+        raise SfntError("No postscript name")
+    def _read_style_flags(self):
+        # These mirror FreeType's FT_STYLE_FLAG_ITALIC and FT_STYLE_FLAG_BOLD.
+        flags = 0
+        if self._os2 is not None and self._os2["version"] != 0xffff:
+            if self._os2["fsSelection"] & (1 | 512): # Italic or oblique
+                flags |= 1
+            if self._os2["fsSelection"] & 32:
+                flags |= 2
+        else:
+            if self._head["macStyle"] & 2:
+                flags |= 1
+            if self._head["macStyle"] & 1:
+                flags |= 2
+        return flags
+    def _read_face_flags(self):
+        # Only FT_FACE_FLAG_FIXED_WIDTH is supported.
+        if self._post is not None and self._post["isFixedPitch"]:
+            return 4
+        return 0
+    def get_sfnt(self):
+        return self._sfnt
+    def get_sfnt_table(self, name):
+        return {"OS/2": self._os2, "post": self._post, "head": self._head}.get(name)
+    def get_charmap(self):
+        # Fall back to FreeType for fonts with unusual character maps.
+        if self._charmap is None:
+            if self._cmap is None:
+                from matplotlib import ft2font
+                self._charmap = ft2font.FT2Font(self.fname).get_charmap()
+            else:
+                self._charmap = dict(zip(self._cmap[0].tolist(), self._cmap[1].tolist()))
+        return self._charmap
+    def get_coverage(self):
+        """The characters in the font, as a list of [first, last] codepoint ranges.
+
+        This is equivalent to, but much faster than, finding the ranges of
+        the keys of get_charmap.
+        """
+        if self._cmap is None:
+            codes = np.asarray(sorted(self.get_charmap().keys()), dtype=np.int64)
+        else:
+            codes = self._cmap[0]
+        if len(codes) == 0:
+            return []
+        breaks = np.flatnonzero(np.diff(codes) != 1)
+        firsts = np.concatenate([[codes[0]], codes[breaks+1]])
+        lasts = np.concatenate([codes[breaks], [codes[-1]]])
+        return np.stack([firsts, lasts], axis=1).tolist()
+    def get_ps_font_info(self):
+        # FreeType only provides postscript font info for CFF-based fonts,
+        # where it comes from the CFF table.  This is rare enough that we just
+        # ask FreeType for it.
+        if not self._cff:
+            raise ValueError("Could not get PS font info")
+        if self._ps_font_info is None:
+            from matplotlib import ft2font
+            if self._index == 0:
+                font = ft2font.FT2Font(self.fname)
+            else:
+                font = ft2font.FT2Font(self.fname, face_index=self._index)
+            self._ps_font_info = font.get_ps_font_info()
+        return self._ps_font_info
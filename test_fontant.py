@@ -0,0 +1,225 @@
+import concurrent.futures
+import os
+import subprocess
+import sys
+import pytest
+from matplotlib import ft2font
+from cand import fontant
+from cand.cache import LRUCache
+
+def test_font_index_reused(tmp_path, monkeypatch):
+    monkeypatch.setenv("CAND_CACHE_DIR", str(tmp_path))
+    fonts = fontant.build_font_index(rebuild=True)
+    assert len(fonts) > 0
+    assert (tmp_path / "fontindex.json").exists()
+    # Unchanged fonts should be read from the index rather than reloaded
+    def fail(path):
+        raise AssertionError(f"Font {path} was reloaded")
+    monkeypatch.setattr(fontant, "loadttf", fail)
+    assert fontant.build_font_index() == fonts
+    assert fontant.find_font_family("DejaVu Sans")['regular']['family_name'] == "DejaVu Sans"
+
+def test_font_index_written_safely(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv("CAND_CACHE_DIR", str(tmp_path))
+    umask = os.umask(0o022)
+    try:
+        fontant._write_index({})
+    finally:
+        os.umask(umask)
+    # Other users can read the index
+    assert os.stat(tmp_path / "fontindex.json").st_mode & 0o777 == 0o644
+    # Entries which can't be saved leave no temporary file behind
+    fontant._write_index({"bad": object()})
+    assert "Warning" in capsys.readouterr().out
+    assert os.listdir(tmp_path) == ["fontindex.json"]
+
+def test_system_catalog_from_index(tmp_path, monkeypatch):
+    monkeypatch.setenv("CAND_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(fontant, "_font_list", None)
+    monkeypatch.setattr(fontant, "_font_catalog", None)
+    fontant.build_font_index(rebuild=True)
+    assert fontant.get_font_catalog().has_family("DejaVu Sans")
+
+def test_parallel_scan_matches_serial(tmp_path):
+    bad = tmp_path / "bad.ttf"
+    bad.write_bytes(b"not a font")
+    paths = fontant.get_fonts()[0:8] + [str(bad)]
+    serial = fontant.scan_fonts(paths, processes=1)
+    parallel = fontant.scan_fonts(paths, processes=3)
+    assert serial == parallel
+    assert parallel[str(bad)] is None
+
+def test_parallel_scan_isolates_crashes(monkeypatch, capsys):
+    paths = fontant.get_fonts()[0:12]
+    bad = paths[5]
+    loadttf = fontant.loadttf
+    def crash_on_bad(path):
+        # Kill the worker, like a segfault in FreeType would, every time
+        # the bad font is loaded, including when it is retried.
+        if path == bad:
+            os._exit(1)
+        return loadttf(path)
+    monkeypatch.setattr(fontant, "loadttf", crash_on_bad)
+    results = fontant.scan_fonts(paths, processes=3)
+    assert [p for p in paths if results[p] is None] == [bad]
+    assert capsys.readouterr().out.count("could not be loaded") == 1
+
+def test_parallel_scan_crash_uses_few_processes(monkeypatch, capsys):
+    # Only the shards being loaded when a worker crashed are split up, so
+    # the number of pools is logarithmic in the number of fonts
+    paths = fontant.get_fonts()[0:40]
+    bad = paths[17]
+    loadttf = fontant.loadttf
+    def crash_on_bad(path):
+        if path == bad:
+            os._exit(1)
+        return loadttf(path)
+    monkeypatch.setattr(fontant, "loadttf", crash_on_bad)
+    pools = []
+    executor = concurrent.futures.ProcessPoolExecutor
+    def count_pools(*args, **kwargs):
+        pools.append(kwargs.get("max_workers"))
+        return executor(*args, **kwargs)
+    monkeypatch.setattr(concurrent.futures, "ProcessPoolExecutor", count_pools)
+    results = fontant.scan_fonts(paths, processes=2)
+    assert [p for p in paths if results[p] is None] == [bad]
+    assert capsys.readouterr().out.count("could not be loaded") == 1
+    assert len(pools) <= 8
+
+def test_catalog_name_matching():
+    fonts = [{"family_name": fam, "full_name": full, "postscript_name": ps,
+              **{prop: None for prop in fontant.FontCatalog.PROPERTIES}}
+             for fam,full,ps in [("Foo Sans", "Foo Sans Bold", "FooSans-Bold"),
+                                 ("Foo Sans", "Foo Sans", "FooSans"),
+                                 ("Foo", "Foo Regular", "Foo-Regular"),
+                                 ("Bar", "Bar Foo", "Bar-Foo")]]
+    catalog = fontant.FontCatalog(fonts)
+    assert catalog.match_name("foo") == {2} # Exact family match
+    assert catalog.match_name("sans") == {0, 1} # Family matches only
+    assert catalog.match_name("foosans-bold") == {0} # Postscript name
+    assert catalog.match_name("bar foo") == {3}
+    assert catalog.match_name("baz") == set()
+
+def test_sfnt_reader_matches_freetype(monkeypatch):
+    paths = fontant.get_fonts()
+    fast = [fontant.loadttf(p) for p in paths]
+    def unsupported(path):
+        raise fontant.SfntError("Disabled")
+    monkeypatch.setattr(fontant, "SfntFont", unsupported)
+    assert fast == [fontant.loadttf(p) for p in paths]
+
+def make_font(family, style, weight, cff=False):
+    # A small font with two glyphs, built with fontTools
+    from fontTools.fontBuilder import FontBuilder
+    from fontTools.pens.t2CharStringPen import T2CharStringPen
+    from fontTools.pens.ttGlyphPen import TTGlyphPen
+    glyphs = [".notdef", "A", "B"]
+    fb = FontBuilder(1000, isTTF=not cff)
+    fb.setupGlyphOrder(glyphs)
+    fb.setupCharacterMap({ord("A"): "A", ord("B"): "B"})
+    def draw(pen):
+        pen.moveTo((100, 0))
+        pen.lineTo((400, 0))
+        pen.lineTo((400, 700))
+        pen.closePath()
+    psname = (family + "-" + style).replace(" ", "")
+    if cff:
+        charstrings = {}
+        for g in glyphs:
+            pen = T2CharStringPen(500, None)
+            draw(pen)
+            charstrings[g] = pen.getCharString()
+        fb.setupCFF(psname, {"FamilyName": family, "FullName": f"{family} {style}", "Weight": style}, charstrings, {})
+    else:
+        pen = TTGlyphPen(None)
+        draw(pen)
+        fb.setupGlyf({g: pen.glyph() for g in glyphs})
+    fb.setupHorizontalMetrics({g: (500, 0) for g in glyphs})
+    fb.setupHorizontalHeader(ascent=800, descent=-200)
+    fb.setupNameTable({"familyName": family, "styleName": style, "psName": psname})
+    fb.setupOS2(usWeightClass=weight, fsSelection=0x20 if weight >= 700 else 0x40)
+    fb.setupPost()
+    return fb.font
+
+def test_sfnt_reader_matches_freetype_otf_and_ttc(tmp_path, monkeypatch):
+    pytest.importorskip("fontTools")
+    from fontTools.ttLib import TTCollection
+    make_font("Fixture Sans", "Bold", 700, cff=True).save(str(tmp_path / "cff.otf"))
+    collection = TTCollection()
+    collection.fonts = [make_font("Fixture Serif", "Regular", 400), make_font("Fixture Serif", "Bold", 700)]
+    collection.save(str(tmp_path / "two.ttc"))
+    paths = [str(tmp_path / "cff.otf"), str(tmp_path / "two.ttc")]
+    fast = [fontant.loadttf(p) for p in paths]
+    assert fast[0]["family_name"] == "Fixture Sans"
+    assert fast[1]["num_faces"] == 2
+    # Every face matches FreeType, including faces after the first in the ttc
+    getters = [fontant.get_fullname, fontant.get_familyname, fontant.get_style, fontant.get_weight,
+               fontant.get_weightnumber, fontant.get_stretch, fontant.get_identifier, fontant.get_version,
+               fontant.get_special, fontant.get_base_style, fontant.get_coverage]
+    for path,index in [(paths[0], 0), (paths[1], 0), (paths[1], 1)]:
+        sfnt = fontant.SfntFont(path, index)
+        freetype = ft2font.FT2Font(path, face_index=index)
+        assert [g(sfnt) for g in getters] == [g(freetype) for g in getters]
+        assert sfnt.postscript_name == freetype.postscript_name
+    assert fontant.SfntFont(paths[0]).get_ps_font_info() == ft2font.FT2Font(paths[0]).get_ps_font_info()
+    def unsupported(path):
+        raise fontant.SfntError("Disabled")
+    monkeypatch.setattr(fontant, "SfntFont", unsupported)
+    assert fast == [fontant.loadttf(p) for p in paths]
+
+def test_bundled_fonts_skip_system_scan(monkeypatch):
+    def fail():
+        raise AssertionError("System fonts were scanned")
+    monkeypatch.setattr(fontant, "get_fonts", fail)
+    monkeypatch.setattr(fontant, "_font_list", None)
+    monkeypatch.setattr(fontant, "_font_catalog", None)
+    fontant._find_font_cache.clear()
+    fontant._find_font_family_cache.clear()
+    family = fontant.find_font_family("DejaVu Sans")
+    assert set(family.keys()) == {"regular", "bold", "italic", "bolditalic"}
+    assert all(f['fname'].startswith(fontant.matplotlib.get_data_path()) for f in family.values())
+
+def test_lru_cache_eviction():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3) # Evicts "b", the least recently used
+    assert "b" not in cache
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert cache.stats() == {"hits": 2, "misses": 1, "evictions": 1, "size": 2, "maxsize": 2}
+    cache.clear()
+    assert len(cache) == 0
+
+def test_warm_up_caches_families(tmp_path, monkeypatch):
+    monkeypatch.setenv("CAND_CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("CAND_WARM_FONTS", "DejaVu Sans Mono")
+    fontant.clear_font_caches()
+    families = fontant.warm_up()
+    assert [f['regular']['family_name'] for f in families] == ["DejaVu Sans", "DejaVu Sans Mono"]
+    hits = fontant.font_cache_stats()["find_font_family"]["hits"]
+    fontant.find_font_family("DejaVu Sans Mono")
+    assert fontant.font_cache_stats()["find_font_family"]["hits"] == hits + 1
+    assert fontant.main(["build-index", "DejaVu Sans"]) == 0
+
+def test_find_font_covering():
+    dejavu = fontant.find_font_family("DejaVu Sans")["regular"]
+    assert fontant.missing_glyphs(dejavu, "Ab α") == set()
+    assert fontant.missing_glyphs(dejavu, "a漢") == {"漢"}
+    assert fontant.missing_glyphs(fontant.find_font("cmr10"), "xα") == {"α"}
+    font = fontant.find_font_covering("xα", "cmr10")
+    assert fontant.missing_glyphs(font, "xα") == set()
+    assert font['family_name'] == "DejaVu Sans"
+    # The font may also be given as a file
+    assert fontant.find_font_covering("Ab", dejavu['fname']) == dejavu
+    cmr10 = fontant.find_font("cmr10")['fname']
+    assert fontant.find_font_covering("xα", cmr10)['family_name'] == "DejaVu Sans"
+
+def test_command_line(tmp_path):
+    env = dict(os.environ, CAND_CACHE_DIR=str(tmp_path))
+    out = subprocess.run([sys.executable, "-m", "cand", "build-index", "DejaVu Sans"],
+                         env=env, capture_output=True, text=True)
+    assert out.returncode == 0
+    assert "RuntimeWarning" not in out.stderr
+    assert (tmp_path / "fontindex.json").exists()
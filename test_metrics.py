@@ -1,5 +1,11 @@
 from cand import *
 import numpy as np
+from PIL import Image
+import matplotlib.figure
+import paranoid as pns
+import pytest
+import cand.canvas
+from cand.metrics import BinopPointArray
 
 lower_points = [Point(.3, .2, "newunit"),
                 Point(.02, .4, "absolute")]
@@ -199,3 +205,397 @@ def test_example_canvas():
 
 
 
+
+def test_font_properties_cached():
+    c = Canvas(4, 4)
+    fprops = c._get_font(weight="bold")
+    assert c._get_font(weight="bold") is fprops
+    assert c._get_font(weight="bold", size=c.fontsize+1) is not fprops
+    c.set_font("DejaVu Sans", size=10)
+    assert c._get_font(weight="bold") is not fprops
+
+def test_text_size(monkeypatch):
+    c = Canvas(4, 4)
+    size = c.text_size("Hello world")
+    assert size.coordinate == "absolute"
+    assert 0 < size.y < size.x
+    assert c.text_size("Hello world", size=16).x > size.x
+    rotated = c.text_size("Hello world", rotation=90)
+    assert abs(rotated.x - size.y) < 1e-6 and abs(rotated.y - size.x) < 1e-6
+    from cand.canvas import text_size_cache_stats
+    hits = text_size_cache_stats()["hits"]
+    assert c.text_size("Hello world") == size
+    assert text_size_cache_stats()["hits"] == hits + 1
+    assert len(c.figure.texts) == 0
+    # Arguments which are dicts are cached, and other unhashable arguments
+    # skip the cache
+    boxed = c.text_size("Hello world", bbox=dict(facecolor="w", pad=2))
+    assert c.text_size("Hello world", bbox=dict(pad=2, facecolor="w")) == boxed
+    assert text_size_cache_stats()["hits"] == hits + 2
+    assert c.text_size("Hello world", bbox={"facecolor": "w", "gid": {1}}) == boxed
+    # The figure's dpi does not affect, and is not changed by, measurements
+    c.figure.set_dpi(300)
+    dpi = matplotlib.figure.Figure.dpi
+    changed = []
+    monkeypatch.setattr(matplotlib.figure.Figure, "dpi", property(dpi.fget, lambda fig, v: changed.append(fig) or dpi.fset(fig, v)))
+    assert c.text_size("Hello world", size=11) == Canvas(4, 4).text_size("Hello world", size=11)
+    assert c.figure not in changed and c.figure.dpi == 300
+
+def test_points_hashable_and_immutable():
+    p = Point(.3, .2, "newunit")
+    binop = p + Vector(1, 2, "absolute")
+    assert {p: 1}[Point(.3, .2, "newunit")] == 1
+    assert {binop: 1}[Point(.3, .2, "newunit") + Vector(1, 2, "absolute")] == 1
+    assert p != Vector(.3, .2, "newunit")
+    assert len({p, Vector(.3, .2, "newunit"), binop, binop - p}) == 4
+    for obj in [p, binop]:
+        assert not hasattr(obj, "__dict__")
+        try:
+            obj.x = 1
+        except AttributeError:
+            pass
+        else:
+            raise AssertionError("Points should be immutable")
+
+def test_production_mode():
+    def convert():
+        c = Canvas(4, 4)
+        c.add_unit("newunit", Vector(.5, .5, "figure"), Point(.1, .1, "figure"))
+        return c.convert_to_absolute_coord((Point(.3, .2, "newunit") | Point(1, 1, "figure")) + Width(2, "pt"))
+    @pns.accepts(pns.Number)
+    def users_function(x):
+        return x
+    # Production mode may already be on, e.g. with CAND_PRODUCTION=1
+    was_production = is_production_mode()
+    disable_production_mode()
+    try:
+        checked_add = Point.__add__
+        checked = convert()
+        enable_production_mode()
+        assert is_production_mode()
+        assert Point.__add__ is not checked_add
+        assert points_close(convert(), checked)
+        # Array methods are unchecked too
+        assert not hasattr(PointArray.__add__, "__wrapped__")
+        # Checks outside of CanD still run
+        assert pns.settings.Settings.get("enabled")
+        try:
+            users_function("not a number")
+        except pns.exceptions.ArgumentTypeError:
+            pass
+        else:
+            raise AssertionError("Paranoid Scientist was disabled globally")
+        disable_production_mode()
+        assert not is_production_mode()
+        assert Point.__add__ is checked_add
+    finally:
+        if was_production:
+            enable_production_mode()
+        else:
+            disable_production_mode()
+
+def test_point_arrays():
+    c = Canvas(4, 4)
+    c.add_unit("newunit", Vector(.5, .5, "figure"), Point(.1, .1, "figure"))
+    c.add_axis("ax1", Point(.1, .1, "figure"), Point(.5, .5, "figure"))
+    xs = np.linspace(0, 1, 5)
+    def build(p):
+        return [p, p + Vector(1, 2, "absolute"), (p | Point(1, 1, "newunit")) >> Point(0, .5, "axis_ax1"),
+                Point(.2, .2, "figure") - p, (p - Point(0, 0, "ax1"))*2 + Point(.1, .1, "figure")]
+    for coord in ["figure", "newunit", "ax1", "axis_ax1", ("ax1", "newunit")]:
+        arrays = [c.convert_to_absolute_array(e) for e in build(PointArray(xs, 1-xs, coord))]
+        for i in range(0, len(xs)):
+            for arr,e in zip(arrays, build(Point(xs[i], 1-xs[i], coord))):
+                assert np.allclose(arr[i], tuple(c.convert_to_absolute_coord(e)))
+    pa = PointArray(xs, 0, "newunit")
+    assert pa[1] == Point(.25, 0, "newunit")
+    assert len(pa + Vector(1, 1, "absolute")) == 5
+    assert PointArray.from_points(list(pa)) == pa
+    # Equal arrays have equal hashes
+    assert PointArray([0.0], [0]) == PointArray([-0.0], [0])
+    assert hash(PointArray([0.0], [0])) == hash(PointArray([-0.0], [0]))
+    assert hash(VectorArray([1, 0.0], -0.0)) == hash(VectorArray([1, -0.0], 0))
+    # Like Points, PointArrays cannot be added together
+    for lhs,rhs in [(pa, pa), (pa, Point(0, 0)), (Point(0, 0), pa)]:
+        try:
+            lhs + rhs
+        except (ValueError, pns.exceptions.ArgumentTypeError):
+            pass
+        else:
+            raise AssertionError("Points were added together")
+    # Arrays of different lengths cannot be combined, even in different
+    # coordinate systems
+    for lhs,rhs in [(PointArray(xs, 0, "cm"), VectorArray([1, 2], 0, "cm")),
+                    (PointArray(xs, 0, "cm"), VectorArray([1, 2], 0, "in")),
+                    (PointArray(xs, 0, "cm") + VectorArray(xs, 0, "in"), VectorArray([1, 2], 0, "in"))]:
+        try:
+            lhs + rhs
+        except ValueError as e:
+            assert "lengths" in str(e)
+        else:
+            raise AssertionError("Arrays of different lengths were combined")
+    assert len(PointArray(xs, 0, "cm") + VectorArray([1], 0, "in")) == 5
+    # Arrays are immutable
+    for arr in [pa, VectorArray(xs, 0, "cm")]:
+        for change in [lambda : setattr(arr, "x", xs), lambda : delattr(arr, "x")]:
+            try:
+                change()
+            except AttributeError:
+                pass
+            else:
+                raise AssertionError("Array was modified")
+    assert pa[1] == Point(.25, 0, "newunit")
+    # Binop arrays can be indexed, sliced, and iterated over
+    ys = 1 - xs
+    e = PointArray(xs, ys, "cm") + VectorArray(xs, 0, "in")
+    assert e[1] == Point(xs[1], ys[1], "cm") + Vector(xs[1], 0, "in")
+    assert isinstance(e[1], BinopPoint)
+    assert isinstance(e[1:3], BinopPointArray) and len(e[1:3]) == 2 and e[1:3][0] == e[1]
+    assert list(e) == [e[i] for i in range(0, len(xs))]
+    assert np.allclose(c.convert_many(list(e)), c.convert_to_absolute_array(e))
+    try:
+        PointArray.from_points(list(e))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Binops have no single coordinate system")
+    v = (VectorArray(xs, 0, "cm") - VectorArray(1, ys, "in"))*2
+    assert isinstance(v[2], BinopVector)
+    assert np.allclose(tuple(c.convert_to_absolute_coord(v[2])), c.convert_to_absolute_array(v)[2])
+    assert len(list(v[::2])) == 3
+    # Leaves of Binop arrays are converted once per coordinate system
+    calls = []
+    leaf = c._convert_array_leaf
+    c._convert_array_leaf = lambda points: calls.append(points.coordinate) or leaf(points)
+    e = ((PointArray(xs, xs, "ax1") | PointArray(xs, 0, "figure")) >> PointArray(xs, 1, "ax1")) + VectorArray(xs, xs, "cm")
+    arr = c.convert_to_absolute_array(e)
+    # Both ax1 leaves are converted together
+    assert calls.count("ax1") == 1 and calls.count("figure") == 1
+    for i in range(0, len(xs)):
+        p = ((Point(xs[i], xs[i], "ax1") | Point(xs[i], 0, "figure")) >> Point(xs[i], 1, "ax1")) + Vector(xs[i], xs[i], "cm")
+        assert np.allclose(arr[i], tuple(c.convert_to_absolute_coord(p)))
+
+def test_shared_subexpressions():
+    c = Canvas(4, 4)
+    c.add_axis("ax1", Point(.1, .1, "figure"), Point(.5, .5, "figure"))
+    corner = Point(.5, .5, "ax1") << Point(.1, .1, "figure")
+    assert (Point(.1, .2, "figure") | corner) is (Point(.1, .2, "figure") | corner)
+    calls = []
+    autoscale = c.ax("ax1").autoscale_view
+    c.ax("ax1").autoscale_view = lambda *args, **kwargs: calls.append(1) or autoscale(*args, **kwargs)
+    # Without sharing, this tree would have 2**40 leaves
+    p = corner
+    for i in range(0, 40):
+        p = (p | p) + Vector(0, 0, "absolute")
+    assert points_close(c.convert_to_absolute_coord(p), c.convert_to_absolute_coord(corner))
+    # The axis is only autoscaled once, until its data changes
+    assert len(calls) == 1
+
+def test_deep_expressions():
+    c = Canvas(4, 4)
+    p = Point(0, 0, "figure")
+    for i in range(0, 5000):
+        p = p + Vector(.001, 0, "in") - Vector(0, .001, "figure")
+    assert points_close(c.convert_to_absolute_coord(p), Point(5, -.004*5000, "absolute"))
+    assert p._compile() is p._compile()
+
+def test_affine_normal_form():
+    c = Canvas(4, 4)
+    c.add_unit("newunit", Vector(.5, .5, "figure"), Point(.1, .1, "figure"))
+    p = Point(0, 0, "newunit")
+    for i in range(0, 100):
+        p = (p + Vector(.01, 0, "cm") @ 30) | (Point(1, 1, "figure") >> p)
+    const,terms = p._affine
+    assert set(terms.keys()) == {"newunit", "cm", "figure"}
+    assert np.allclose(c._affine_to_absolute(p._affine), c._evaluate(p._compile()))
+    assert points_close(c.convert_to_absolute_coord(p), Point(*c._evaluate(p._compile()), "absolute"))
+
+def test_conversion_cache_invalidation():
+    c = Canvas(4, 4)
+    c.add_unit("newunit", Vector(.5, .5, "figure"), Point(.1, .1, "figure"))
+    c.add_axis("ax1", Point(.1, .1, "figure"), Point(.5, .5, "figure"))
+    c.ax("ax1").plot([0, 1], [0, 1])
+    p = Point(1, 2, "ax1") + Vector(.1, .1, "default")
+    def fresh():
+        c2 = Canvas(4, 4)
+        c2.add_unit("newunit", Vector(.5, .5, "figure"), Point(.1, .1, "figure"))
+        c2.add_axis("ax1", Point(.1, .1, "figure"), Point(.5, .5, "figure"))
+        for line in c.ax("ax1").lines:
+            c2.ax("ax1").plot(*line.get_data())
+        c2.ax("ax1").set_position(c.ax("ax1").get_position())
+        c2.ax("ax1").set_yscale(c.ax("ax1").get_yscale())
+        if not c.ax("ax1").get_autoscaley_on():
+            c2.ax("ax1").set_ylim(c.ax("ax1").get_ylim())
+        c2.set_default_unit(c.default_unit)
+        return c2.convert_to_absolute_coord(p)
+    first = c.convert_to_absolute_coord(p)
+    hits = c._conversion_cache.stats()["hits"]
+    assert c.convert_to_absolute_coord(p) is first
+    assert c._conversion_cache.stats()["hits"] == hits + 1
+    changes = [lambda : c.set_default_unit("newunit"),
+               lambda : c.ax("ax1").plot([0, 3], [0, 2]),
+               lambda : c.ax("ax1").set_ylim(1, 5),
+               lambda : c.ax("ax1").set_yscale("log"),
+               lambda : c.ax("ax1").set_position([.2, .2, .3, .3])]
+    for change in changes:
+        before = c.convert_to_absolute_coord(p)
+        change()
+        after = c.convert_to_absolute_coord(p)
+        assert not points_close(before, after)
+        assert points_close(after, fresh())
+
+def test_figure_size_and_dpi_invalidate_conversions():
+    c = Canvas(4, 4)
+    c.add_axis("ax1", Point(.1, .1, "figure"), Point(.5, .5, "figure"))
+    c.ax("ax1").set_xlim(0, 1)
+    c.ax("ax1").set_ylim(0, 1)
+    for size in [(5, 5), (6, 3), (2, 4)]:
+        c.convert_to_absolute_coord(Point(1, 1, "figure"))
+        version = c._version
+        c.figure.set_size_inches(*size)
+        assert c._version > version
+        assert points_close(c.convert_to_absolute_coord(Point(1, 1, "ax1")), Point(size[0]/2, size[1]/2, "absolute"))
+    for dpi in [200, 50, 300]:
+        version = c._version
+        c.figure.set_dpi(dpi)
+        assert c._version > version
+        assert points_close(c.convert_to_absolute_coord(Point(0, 0, "ax1")), Point(.2, .4, "absolute"))
+
+def test_autoscale_settings_invalidate_conversions():
+    c = Canvas(4, 4)
+    ax = c.add_axis("ax1", Point(0, 0, "figure"), Point(1, 1, "figure"))
+    ax.imshow(np.zeros((2, 2)), aspect="auto")
+    def expected(p):
+        ax.autoscale_view()
+        return Point(*(ax.transData + c.trans_absolute.inverted()).transform((p.x, p.y)), "absolute")
+    p = Point(1.5, 1.5, "ax1")
+    assert points_close(c.convert_to_absolute_coord(p), expected(p))
+    # Images have sticky edges, so margins don't apply until these are disabled
+    ax.use_sticky_edges = False
+    assert points_close(c.convert_to_absolute_coord(p), expected(p))
+    ax.margins(.3)
+    assert points_close(c.convert_to_absolute_coord(p), expected(p))
+    ax.set_autoscale_on(False)
+    ax.set_xlim(0, 3)
+    assert points_close(c.convert_to_absolute_coord(p), expected(p))
+    assert c.convert_to_absolute_coord(p).x == 2
+    ax.set_autoscale_on(True)
+    assert points_close(c.convert_to_absolute_coord(p), expected(p))
+
+def test_conversions_without_axis_hooks(monkeypatch):
+    # Without matplotlib's private hooks, conversions are not cached
+    monkeypatch.setattr(cand.canvas, "_can_watch_axes", False)
+    c = Canvas(4, 4)
+    c.add_axis("ax1", Point(.1, .1, "figure"), Point(.5, .5, "figure"))
+    c.ax("ax1").set_xlim(0, 1)
+    c.ax("ax1").set_ylim(0, 1)
+    p = Point(1, 1, "ax1") + Vector(.1, .1, "figure")
+    assert points_close(c.convert_to_absolute_coord(p), Point(2.4, 2.4, "absolute"))
+    c.ax("ax1").set_xlim(0, 2)
+    assert points_close(c.convert_to_absolute_coord(p), Point(1.6, 2.4, "absolute"))
+    c.ax("ax1").set_position([.25, .25, .5, .5])
+    assert np.allclose(c.convert_many([p, Point(2, 0, "ax1")]), [[2.4, 3.4], [3, 1]])
+    assert len(c._conversion_cache) == 0
+
+def test_axis_transform_cache():
+    c = Canvas(4, 4)
+    c.add_axis("ax1", Point(.1, .1, "figure"), Point(.5, .5, "figure"))
+    c.ax("ax1").plot([0, 1], [0, 1])
+    tf = c._axis_transform("ax1")
+    assert c._axis_transform("ax1") is tf
+    calls = []
+    autoscale = c.ax("ax1").autoscale_view
+    c.ax("ax1").autoscale_view = lambda *args, **kwargs: calls.append(1) or autoscale(*args, **kwargs)
+    for i in range(0, 10):
+        c.convert_to_absolute_coord(Point(i, i, "ax1") + Vector(1, 0, "axis_ax1"))
+    assert calls == []
+    # Data on linear axes can be converted without evaluating the tree
+    p = Point(.5, .5, "ax1") | Point(.2, .3, "axis_ax1")
+    assert c._affine_to_absolute(p._affine) is not None
+    c.ax("ax1").set_xlim(0, 2)
+    c.ax("ax1").set_ylim(0, 1)
+    assert c._axis_transform("ax1") is not tf
+    assert points_close(c.convert_to_absolute_coord(Point(2, 1, "ax1")), Point(2, 2, "absolute"))
+    c.ax("ax1").set_xscale("log")
+    assert c._affine_to_absolute(p._affine) is None
+    assert points_close(c.convert_to_absolute_coord(p), Point(*c._evaluate(p._compile()), "absolute"))
+
+def test_convert_many():
+    c = Canvas(4, 4)
+    c.add_axis("ax1", Point(.1, .1, "figure"), Point(.5, .5, "figure"))
+    c.ax("ax1").plot([0, 1], [0, 1])
+    points = [Point(.5, .5, "ax1"), Vector(1, 2, "cm"), Point(.2, .3, "figure"),
+              Point(1, 1, "ax1") | Point(0, 0, "absolute"), Width(3, "Msize"),
+              Point(1, 0, "ax1"), Vector(.1, .1, "axis_ax1") @ 30]
+    expected = np.asarray([tuple(c.convert_to_absolute_coord(p)) for p in points])
+    assert np.allclose(c.convert_many(points), expected)
+    assert np.allclose(c.convert_many(points, to="figure"), expected/4)
+    assert c.convert_many([]).shape == (0, 2)
+    arr = PointArray([0, .5, 1], [1, .5, 0], "ax1")
+    assert np.allclose(c.convert_many(arr), c.convert_many(list(arr)))
+    # The leaves of Binops are converted along with the other Points
+    calls = []
+    leaf = c._convert_array_leaf
+    c._convert_array_leaf = lambda points: calls.append(points.coordinate) or leaf(points)
+    points += [Point(i, 0, "ax1") + Vector(i, 1, "cm") for i in range(0, 10)]
+    expected = np.asarray([tuple(c.convert_to_absolute_coord(p)) for p in points])
+    assert np.allclose(c.convert_many(points), expected)
+    assert calls.count("ax1") == 1
+    # The target coordinate system is checked before converting
+    with pytest.raises(ValueError, match="bad"):
+        c.convert_many([Point(0, 0, "nonexistent")], to="bad")
+
+def test_debug_grid():
+    c = Canvas(4, 4)
+    c.debug_grid(Vector(1, 1.5, "in"), origin=Point(.5, .5, "in"))
+    lines = [l.get_xydata() for l in c.figure.artists]
+    assert sorted({l[0,0] for l in lines if l[0,0] == l[1,0]}) == [.5, 1.5, 2.5, 3.5]
+    assert sorted({l[0,1] for l in lines if l[0,1] == l[1,1]}) == [.5, 2, 3.5]
+    # Grid lines on a nonlinear axis are not evenly spaced
+    c = Canvas(4, 4)
+    ax = c.add_axis("ax1", Point(0, 0, "figure"), Point(1, 1, "figure"))
+    ax.set_xscale("symlog")
+    ax.set_xlim(-105, 105)
+    ax.set_ylim(0, 1)
+    c.debug_grid(Vector(10, .25, "ax1"), origin=Point(0, 0, "ax1"))
+    lines = [l.get_xydata() for l in c.figure.artists]
+    expected = [c.convert_to_absolute_coord(Point(10*i, 0, "ax1")).x for i in range(-10, 11)]
+    assert np.allclose(sorted({l[0,0] for l in lines if l[0,0] == l[1,0]}), expected)
+    assert np.allclose(sorted({l[0,1] for l in lines if l[0,1] == l[1,1]}), [0, 1, 2, 3, 4])
+
+def test_convert_from_absolute():
+    c = Canvas(4, 4)
+    c.add_unit("newunit", Vector(.5, .5, "figure"), Point(.1, .1, "figure"))
+    c.add_axis("ax1", Point(.1, .1, "figure"), Point(.5, .5, "figure"))
+    c.ax("ax1").plot([1, 10], [1, 100])
+    c.ax("ax1").set_yscale("log")
+    for coordinate in ["figure", "cm", "newunit", "Msize", "-absolute", "ax1", "axis_ax1", "default"]:
+        for p in [Point(1.5, 2, "absolute"), Vector(.2, .3, "absolute"), Point(.5, .5, "axis_ax1") + Vector(1, 0, "mm")]:
+            # Vectors start at 0, which is not on a log scale
+            if coordinate == "ax1" and isinstance(p, Vector):
+                continue
+            converted = c.convert_from_absolute(p, coordinate)
+            assert converted.coordinate == coordinate
+            assert type(converted) == (Vector if isinstance(p, Vector) else Point)
+            assert points_close(c.convert_to_absolute_coord(converted), c.convert_to_absolute_coord(p))
+    assert points_close(c.convert_from_absolute(Point(.2, .3, "figure"), "newunit"), Point(.2, .4, "newunit"))
+    arr = PointArray(np.linspace(0, 4, 1000), np.linspace(1, 3, 1000), "absolute")
+    data = c.convert_from_absolute(arr, "ax1")
+    assert isinstance(data, PointArray) and data.coordinate == "ax1"
+    assert np.allclose(c.convert_to_absolute_array(data), c.convert_to_absolute_array(arr))
+    assert c._inverse_transform("ax1") is c._inverse_transform("ax1")
+    c.ax("ax1").set_ylim(1, 10)
+    assert not np.allclose(c.convert_from_absolute(arr, "ax1").y, data.y)
+
+def test_save_png_with_image(tmp_path):
+    Image.new("RGBA", (30, 20), (255, 0, 0, 255)).save(tmp_path / "red.png")
+    c = Canvas(2, 1, "in")
+    c.add_image(str(tmp_path / "red.png"), Point(0, 0, "figure"), width=Width(.5, "figure"), height=Height(1, "figure"), ha="left", va="bottom")
+    c.save(str(tmp_path / "out.png"), dpi=50, metadata={"Title": "Test"})
+    with Image.open(tmp_path / "out.png") as img:
+        assert img.size == (100, 50)
+        assert img.text["Title"] == "Test"
+        assert img.text["Software"].startswith("CanD")
+        pixels = np.asarray(img)
+    assert (pixels[:,0:50] == [255, 0, 0, 255]).all()
+    assert (pixels[:,50:] == [255, 255, 255, 255]).all()
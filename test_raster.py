@@ -0,0 +1,96 @@
+import os
+import io
+import numpy as np
+import fitz as mupdf
+from PIL import Image
+from cand import Canvas, Point, Width
+from cand import raster
+from cand.cache import MemoryLRUCache
+
+def make_pdf(path, size=(2, 1)):
+    c = Canvas(*size, "in")
+    c.add_axis("ax", Point(.1, .1, "figure"), Point(.9, .9, "figure"))
+    c.save(str(path))
+
+def test_pdf_pages_cached(tmp_path):
+    make_pdf(tmp_path / "sub.pdf")
+    raster.clear_raster_cache()
+    img = raster.rasterize_pdf(str(tmp_path / "sub.pdf"), (288, 144))
+    assert img.mode == "RGBA" and img.size == (288, 144)
+    hits = raster.raster_cache_stats()["hits"]
+    assert raster.rasterize_pdf(str(tmp_path / "sub.pdf"), (288, 144)) is img
+    assert raster.raster_cache_stats()["hits"] == hits + 1
+    # Saving a png at the same size uses the cached page
+    c = Canvas(2, 1, "in")
+    c.add_image(str(tmp_path / "sub.pdf"), Point(0, 0, "figure"), width=Width(1, "figure"), ha="left", va="bottom")
+    c.save(str(tmp_path / "out.png"), dpi=144)
+    c.save(str(tmp_path / "out.png"), dpi=144)
+    assert raster.raster_cache_stats()["hits"] == hits + 3
+    # Changing the file invalidates the cache
+    make_pdf(tmp_path / "sub.pdf", size=(1, 1))
+    stat = os.stat(tmp_path / "sub.pdf")
+    os.utime(tmp_path / "sub.pdf", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert np.asarray(raster.rasterize_pdf(str(tmp_path / "sub.pdf"), (288, 144))).shape == (144, 288, 4)
+    assert raster.raster_cache_stats()["hits"] == hits + 3
+
+def test_pdf_pixmap_matches_png(tmp_path):
+    make_pdf(tmp_path / "sub.pdf")
+    pixmap = mupdf.open(str(tmp_path / "sub.pdf"))[0].get_pixmap(alpha=True, matrix=mupdf.Matrix(3, 3))
+    expected = np.asarray(Image.open(io.BytesIO(pixmap.tobytes("png"))).convert("RGBA"), dtype=int)
+    img = np.asarray(raster.rasterize_pdf(str(tmp_path / "sub.pdf"), (432, 216)), dtype=int)
+    assert np.abs(img - expected).max() <= 1
+    # Clipped pages are the same as the corresponding part of the whole page
+    clipped = np.asarray(raster.rasterize_pdf(str(tmp_path / "sub.pdf"), (432, 216), (100, 20, 300, 216)), dtype=int)
+    assert np.abs(clipped - expected[20:216,100:300]).max() <= 1
+
+def test_memory_lru_cache():
+    cache = MemoryLRUCache(maxbytes=10, sizeof=len)
+    cache.set("a", "xxxx")
+    cache.set("b", "xxxx")
+    assert cache.get("a") == "xxxx"
+    cache.set("c", "xxxx") # Evicts "b", the least recently used
+    assert "b" not in cache and "a" in cache
+    cache.set("d", "x"*11) # Too big to cache
+    assert "d" not in cache
+    assert cache.stats()["bytes"] == 8
+    cache.resize(5)
+    assert len(cache) == 1 and "c" in cache
+    cache.clear()
+    assert cache.stats()["bytes"] == 0
+
+def test_images_cached(tmp_path):
+    Image.new("RGBA", (30, 20), (255, 0, 0, 255)).save(tmp_path / "red.png")
+    raster.clear_raster_cache()
+    assert raster.image_size(str(tmp_path / "red.png")) == (30, 20)
+    assert raster.load_image(str(tmp_path / "red.png")) is raster.resample_image(str(tmp_path / "red.png"), (30, 20))
+    small = raster.resample_image(str(tmp_path / "red.png"), (15, 10))
+    assert small.size == (15, 10)
+    assert raster.resample_image(str(tmp_path / "red.png"), (15, 10)) is small
+    assert raster.raster_cache_stats()["bytes"] == 30*20*4 + 15*10*4
+    # Full decodes are not cached alongside resampled images
+    raster.clear_raster_cache()
+    assert raster.resample_image(str(tmp_path / "red.png"), (15, 10)).size == (15, 10)
+    assert raster.raster_cache_stats()["bytes"] == 15*10*4
+    # Placing the image many times only decodes and resamples it once
+    c = Canvas(2, 1, "in")
+    for i in range(0, 10):
+        c.add_image(str(tmp_path / "red.png"), Point(i/10, 0, "figure"), width=Width(.1, "figure"), ha="left", va="bottom")
+    misses = raster.raster_cache_stats()["misses"]
+    c.save(str(tmp_path / "out.png"), dpi=50)
+    c.save(str(tmp_path / "out.png"), dpi=50)
+    assert raster.raster_cache_stats()["misses"] == misses + 1
+    budget = raster.raster_cache_stats()["maxbytes"]
+    raster.set_raster_cache_size(100)
+    assert raster.raster_cache_stats()["size"] == 0
+    raster.set_raster_cache_size(budget)
+
+def test_raster_cache_budget(monkeypatch, capsys):
+    monkeypatch.setenv("CAND_RASTER_CACHE_MB", "16")
+    assert raster._raster_cache_budget() == 16*2**20
+    assert capsys.readouterr().out == ""
+    for value in ["lots", "-1", "inf"]:
+        monkeypatch.setenv("CAND_RASTER_CACHE_MB", value)
+        assert raster._raster_cache_budget() == 256*2**20
+        assert "Warning" in capsys.readouterr().out
+    monkeypatch.delenv("CAND_RASTER_CACHE_MB")
+    assert raster._raster_cache_budget() == 256*2**20